@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+异步服务模式（ASGI）
+功能：
+1. 提供与 main.py 相同的 /download-subtitle、/health、/download-markdown 接口
+2. yt-dlp 通过 asyncio 子进程运行，Coze 请求通过带连接池的异步 HTTP 客户端（httpx）发送
+3. 等待下载和 Coze 响应时不占用线程，单个进程可以同时挂起成千上万个慢请求
+
+运行: python async_server.py（需要安装: pip install httpx uvicorn）
+也可以交给任意 ASGI 服务器: uvicorn async_server:app --host 0.0.0.0 --port 5001
+"""
+
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, quote
+
+from werkzeug.http import http_date, is_resource_modified, parse_range_header, quote_etag
+from werkzeug.utils import safe_join
+
+import main
+from config import Config
+from logging_utils import get_logger, configure_logging, lazy, summarize_text, redact
+from profiling import request_id_from_header, span, trace_context
+
+logger = get_logger("async_server")
+
+# 发送文件时每次读取的字节数
+FILE_CHUNK_SIZE = 64 * 1024
+
+def _httpx():
+    try:
+        import httpx
+    except ImportError:
+        raise Exception("异步服务需要安装 httpx 模块: pip install httpx")
+    return httpx
+
+async def download_subtitle_async(url, lang='en', browser=None, cookies_file=None):
+    """
+    用 asyncio 子进程运行 yt-dlp 下载字幕
+
+    与 main.download_subtitle 一样通过 main.private_download_dir 下载到独立临时目录再移入字幕目录。
+
+    Returns:
+        str: 下载的字幕文件路径
+    """
+    try:
+        with main.private_download_dir() as download_dir:
+            cmd = main.build_ytdlp_command(url, lang, browser, cookies_file, output_dir=download_dir)
+            logger.debug("执行命令: %s", lazy(' '.join, cmd))
+
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, stderr = await process.communicate()
+            finally:
+                # 请求被取消（如客户端断开）时终止 yt-dlp，再删除临时目录
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+            if process.returncode != 0:
+                raise main.ytdlp_error(stderr.decode('utf-8', errors='replace').strip(), browser)
+
+            return main.move_downloaded_subtitle(download_dir)
+    except Exception as e:
+        raise Exception(f"下载字幕时出错: {str(e)}")
+
+async def send_to_coze_workflow_async(client, workflow_id, token, cleaned_text, file_name):
+    """
+    用异步 HTTP 客户端发送清洗后的文本到 Coze 工作流
+
+    Args:
+        client (httpx.AsyncClient): 复用连接池的客户端
+        workflow_id (str): Coze 工作流 ID
+        token (str): Coze API Token
+        cleaned_text (str): 清洗后的文本内容
+        file_name (str): 字幕文件名
+
+    Returns:
+        dict: 工作流响应
+    """
+    httpx = _httpx()
+    try:
+        api_url, headers, payload = main.build_coze_request(workflow_id, token, cleaned_text)
+
+        logger.info("发送请求到 Coze API: url=%s file=%s subtitle=%s",
+                    api_url, file_name, lazy(summarize_text, cleaned_text))
+        logger.debug("Coze 请求头: %s", lazy(redact, headers))
+        logger.debug("Coze 请求数据: %s", lazy(json.dumps, payload, ensure_ascii=False))
+
+        response = await client.post(api_url, headers=headers, json=payload)
+        return main.parse_coze_response(response.status_code, response.headers, response.content)
+    except httpx.TimeoutException:
+        raise Exception("Coze API 请求超时")
+    except httpx.ConnectError:
+        raise Exception("Coze API 连接错误，请检查网络连接")
+    except httpx.HTTPError as e:
+        raise Exception(f"Coze API 网络请求错误: {str(e)}")
+    except Exception as e:
+        raise Exception(f"发送到 Coze 工作流出错: {str(e)}")
+
+def _read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+class _Request:
+    """ASGI 请求的简单封装"""
+
+    def __init__(self, scope, receive):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = {
+            key: values[0]
+            for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()
+        }
+        self.headers = {
+            key.decode('latin-1').lower(): value.decode('latin-1')
+            for key, value in scope.get('headers', [])
+        }
+        self._receive = receive
+
+    async def body(self):
+        chunks = []
+        while True:
+            message = await self._receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+class AsyncSubtitleApp:
+    """
+    ASGI 应用：与 Flask 服务相同的接口，I/O 等待期间不占用线程
+
+    清洗文本、读写文件等 CPU 或磁盘操作放到默认线程池中执行，不阻塞事件循环。
+    未使用共享后端（BACKEND_URL），需要跨节点缓存和任务队列时请使用 Flask 服务。
+    """
+
+    def __init__(self, max_downloads=None, max_connections=None):
+        """
+        Args:
+            max_downloads (int): 同时运行的 yt-dlp 进程数上限，默认为 Config.ASYNC_MAX_DOWNLOADS
+            max_connections (int): 到 Coze 的连接池大小，默认为 Config.COZE_MAX_CONNECTIONS
+        """
+        self.download_slots = asyncio.Semaphore(max_downloads or Config.ASYNC_MAX_DOWNLOADS)
+        self.max_connections = max_connections or Config.COZE_MAX_CONNECTIONS
+        self._client = None
+
+    @property
+    def client(self):
+        """复用连接池的 Coze 客户端，首次使用时创建"""
+        if self._client is None:
+            httpx = _httpx()
+            self._client = httpx.AsyncClient(
+                timeout=200,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    async def aclose(self):
+        """关闭 Coze 客户端"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        request = _Request(scope, receive)
+        request_id = request_id_from_header(request.headers.get('x-request-id'))
+        with trace_context(request_id) as trace:
+            status, headers, body = await self._dispatch(request)
+        headers = list(headers) + [
+            ('X-Request-ID', request_id),
+            ('Access-Control-Allow-Origin', '*'),
+        ]
+        if trace.spans:
+            headers.append(('Server-Timing', trace.server_timing()))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        })
+        if isinstance(body, bytes):
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        # 文件响应：逐块读取发送，不把整个文件读入内存
+        file, remaining = body
+        try:
+            while remaining > 0:
+                chunk = await asyncio.to_thread(file.read, min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            file.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _dispatch(self, request):
+        """
+        Returns:
+            tuple: (状态码, 响应头列表, 响应体 bytes 或已打开的文件对象)
+        """
+        routes = {
+            '/download-subtitle': ('POST', self.handle_download_request),
+            '/health': ('GET', self.health_check),
+            '/download-markdown': ('GET', self.download_markdown),
+        }
+        if request.path not in routes:
+            return _json_response({"error": "接口不存在"}, 404)
+        method, handler = routes[request.path]
+        if request.method == 'OPTIONS':
+            return 204, [('Access-Control-Allow-Methods', method),
+                         ('Access-Control-Allow-Headers', request.headers.get(
+                             'access-control-request-headers', 'Content-Type'))], b''
+        if request.method != method and not (method == 'GET' and request.method == 'HEAD'):
+            return _json_response({"error": "不支持的请求方法"}, 405)
+        return await handler(request)
+
+    async def health_check(self, request):
+        """
+        健康检查端点
+        """
+        return _json_response({
+            "status": "healthy",
+            "coze_configured": Config.is_coze_configured()
+        })
+
+    async def handle_download_request(self, request):
+        """
+        处理下载字幕的请求，参数和返回内容与 Flask 服务相同
+        """
+        try:
+            logger.info("收到 /download-subtitle 请求: method=%s content_type=%s",
+                        request.method, request.headers.get('content-type'))
+            raw = await request.body()
+            if not raw:
+                return _json_response({"error": "请求体为空"}, 400)
+            try:
+                data = json.loads(raw)
+            except json.JSONDecodeError as e:
+                return _json_response({"error": f"无效的 JSON 数据: {str(e)}"}, 400)
+            logger.debug("请求数据: %s", lazy(redact, data))
+
+            error = main.request_data_error(data)
+            if error:
+                return _json_response(error, 400)
+
+            result = await self.process(data)
+            markdown_file = result.get("markdown_file")
+            if markdown_file:
+                # 直接返回 Markdown 文件供下载
+                with span('send_file'):
+                    return await self.serve_stored_file(request, markdown_file)
+
+            with span('serialize'):
+                return _json_response(result)
+        except Exception as e:
+            logger.exception("异常发生在 /download-subtitle 端点: %s: %s", type(e).__name__, e)
+            return _json_response({"error": str(e)}, 500)
+
+    async def process(self, data):
+        """
+        下载 -> 清洗 -> 发送到 Coze -> 生成 Markdown，结果与 SubtitlePipeline.process 相同
+
+        Args:
+            data (dict): /download-subtitle 的请求参数
+
+        Returns:
+            dict: 包含 status、subtitle_file、cleaned_text、coze_response、markdown_file 等字段
+        """
+        # 只借用 SubtitlePipeline 解析参数和默认值，它的 HTTP 会话是惰性创建的，这里不会用到
+        options = main.pipeline_from_request(data)
+        url = data['url']
+
+        async with self.download_slots:
+            with span('download'):
+                subtitle_file = await download_subtitle_async(
+                    url, options.lang, options.browser, options.cookies_file
+                )
+        with span('read'):
+            subtitle_content = await asyncio.to_thread(_read_text, subtitle_file)
+
+        result = {
+            "status": "success",
+            "url": url,
+            "subtitle_file": subtitle_file,
+            "original_content": subtitle_content
+        }
+
+        text = subtitle_content
+        if options.clean_text:
+            with span('clean'):
+                text = await asyncio.to_thread(main.clean_subtitle_content, subtitle_content)
+            result["cleaned_text"] = text
+
+        if options.send_to_coze:
+            with span('coze'):
+                coze_response = await send_to_coze_workflow_async(
+                    self.client, options.workflow_id, options.token,
+                    text, os.path.basename(subtitle_file)
+                )
+            result["coze_response"] = coze_response
+            with span('markdown'):
+                markdown_file = await asyncio.to_thread(main.save_coze_markdown, coze_response, subtitle_file)
+            if markdown_file:
+                result["markdown_file"] = markdown_file
+        return result
+
+    async def download_markdown(self, request):
+        """
+        下载 Markdown 文件
+        """
+        filename = request.query.get('file')
+        if not filename:
+            return _json_response({"error": "缺少文件名参数"}, 400)
+
+        # safe_join 拒绝 ../ 等越出字幕目录的路径
+        filepath = safe_join(main.SUBTITLES_DIR, filename)
+        if filepath is None or not os.path.isfile(filepath):
+            return _json_response({"error": "文件不存在"}, 404)
+        try:
+            return await self.serve_stored_file(request, filepath)
+        except Exception as e:
+            return _json_response({"error": f"无法发送文件: {str(e)}"}, 500)
+
+    async def serve_stored_file(self, request, path):
+        """
+        以附件形式返回字幕目录中的文件，ETag、304、单个 Range（206 / 416）和 X-Accel-Redirect
+        与 main.serve_stored_file 相同
+
+        Returns:
+            tuple: (状态码, 响应头列表, (已定位到起始位置的文件对象, 要发送的字节数) 或空响应体)
+        """
+        path = os.path.abspath(path)
+        stat = await asyncio.to_thread(os.stat, path)
+        etag = await asyncio.to_thread(main.file_etag, path)
+        mtime = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+        mimetype = main.STORED_FILE_MIMETYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+        if mimetype.startswith('text/'):
+            mimetype += '; charset=utf-8'
+        cache_control = (f"public, max-age={Config.FILE_CACHE_MAX_AGE}"
+                         if Config.FILE_CACHE_MAX_AGE else "no-cache")
+        headers = [
+            ('ETag', quote_etag(etag)),
+            ('Last-Modified', http_date(mtime)),
+            ('Cache-Control', cache_control),
+        ]
+
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'HTTP_IF_NONE_MATCH': request.headers.get('if-none-match', ''),
+            'HTTP_IF_MODIFIED_SINCE': request.headers.get('if-modified-since', ''),
+        }
+        if not is_resource_modified(environ, etag=etag, last_modified=mtime):
+            return 304, headers, b''
+
+        headers.append(('Content-Type', mimetype))
+        headers.append(('Content-Disposition', main._content_disposition(os.path.basename(path))))
+        if Config.X_ACCEL_REDIRECT_PREFIX:
+            relative = os.path.relpath(path, os.path.abspath(main.SUBTITLES_DIR)).replace(os.sep, '/')
+            headers.append(('X-Accel-Redirect',
+                            Config.X_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(relative)))
+            headers.append(('Content-Length', '0'))
+            return 200, headers, b''
+
+        headers.append(('Accept-Ranges', 'bytes'))
+        status, start, length = 200, 0, stat.st_size
+        range_header = request.headers.get('range')
+        if range_header and self._if_range_matches(request, etag, mtime):
+            byte_range = parse_range_header(range_header)
+            # 只支持单个区间，多个区间时按普通请求返回完整文件
+            if byte_range is not None and len(byte_range.ranges) == 1:
+                bounds = byte_range.range_for_length(stat.st_size)
+                if bounds is None:
+                    headers.append(('Content-Range', f'bytes */{stat.st_size}'))
+                    headers.append(('Content-Length', '0'))
+                    return 416, headers, b''
+                start, stop = bounds
+                status, length = 206, stop - start
+                headers.append(('Content-Range', byte_range.to_content_range_header(stat.st_size)))
+
+        headers.append(('Content-Length', str(length)))
+        if request.method == 'HEAD':
+            return status, headers, b''
+        return status, headers, (await asyncio.to_thread(_open_at, path, start), length)
+
+    @staticmethod
+    def _if_range_matches(request, etag, mtime):
+        """没有 If-Range，或 If-Range 中的 ETag / 日期与当前文件一致时才按 Range 返回部分内容"""
+        if_range = request.headers.get('if-range')
+        if not if_range:
+            return True
+        environ = {'HTTP_RANGE': request.headers.get('range'), 'HTTP_IF_RANGE': if_range}
+        return not is_resource_modified(environ, etag=etag, last_modified=mtime, ignore_if_range=False)
+
+def _open_at(path, offset):
+    """以二进制方式打开文件并定位到 offset"""
+    f = open(path, 'rb')
+    f.seek(offset)
+    return f
+
+def _json_response(body, status=200):
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    return status, [('Content-Type', 'application/json'), ('Content-Length', str(len(data)))], data
+
+app = AsyncSubtitleApp()
+
+def run():
+    """
+    命令行模式：用 uvicorn 在 Config.HOST:Config.PORT 上启动异步服务
+    """
+    Config.load_from_file()
+    configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT)
+    try:
+        import uvicorn
+    except ImportError:
+        print("错误: 异步服务需要安装 uvicorn 和 httpx 模块: pip install uvicorn httpx")
+        sys.exit(1)
+
+    print(f"异步服务启动于 http://{Config.HOST}:{Config.PORT}")
+    print(f"字幕保存目录: {os.path.abspath(main.SUBTITLES_DIR)}")
+    print("API 端点:")
+    print("  POST /download-subtitle - 下载字幕并发送到 Coze")
+    print("  GET  /download-markdown - 下载 Markdown 文件")
+    print("  GET  /health - 健康检查")
+    uvicorn.run(app, host=Config.HOST, port=Config.PORT,
+                log_level=Config.LOG_LEVEL.lower(), access_log=False)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+可插拔的共享存储后端，供多个服务实例共享字幕缓存、Coze 结果缓存、单飞锁和任务队列
+
+- MemoryBackend: 进程内实现，用于单实例部署和测试
+- RedisBackend: 基于 Redis 协议的实现，多个节点连接同一个 Redis 即可协同工作（需要安装 redis 包）
+
+通过 Config.BACKEND_URL 选择：留空表示不使用共享后端，memory:// 为进程内实现，redis://... 为 Redis。
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+class LockTimeout(Exception):
+    """在 blocking_timeout 内未能获取锁"""
+
+# 可靠队列：worker 取出的任务先移入自己的处理中列表，处理完成后确认（ack）再删除；
+# worker 定期写入带过期时间的心跳，心跳过期的 worker 处理中的任务会被放回队列
+def _processing_key(queue, worker_id):
+    return f"{queue}:processing:{worker_id}"
+
+def _heartbeat_key(queue, worker_id):
+    return f"{queue}:heartbeat:{worker_id}"
+
+def _workers_key(queue):
+    return f"{queue}:workers"
+
+class MemoryBackend:
+    """进程内后端：带过期时间的键值存储、按名称区分的锁和 FIFO 队列"""
+
+    def __init__(self):
+        self._data = {}
+        self._data_lock = threading.Lock()
+        self._locks = {}
+        self._queues = defaultdict(deque)
+        self._queue_cond = threading.Condition()
+        self._workers = defaultdict(set)
+
+    def get(self, key):
+        """
+        Returns:
+            str: 键对应的值，不存在或已过期时返回 None
+        """
+        with self._data_lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Args:
+            key (str): 键
+            value (str): 值
+            ttl (float): 过期时间（秒），None 表示不过期
+        """
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._data_lock:
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key):
+        with self._data_lock:
+            self._data.pop(key, None)
+
+    @contextmanager
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        """
+        按名称加锁，同名锁同一时间只有一个持有者（单飞）
+
+        Args:
+            name (str): 锁名称
+            timeout (float): 锁的自动过期时间，进程内实现中忽略
+            blocking_timeout (float): 等待锁的最长时间（秒），None 表示一直等待
+
+        Raises:
+            LockTimeout: 超时未获取到锁
+        """
+        # 记录每把锁的等待者数量，无人使用时删除，避免锁表随键数量无限增长
+        with self._data_lock:
+            entry = self._locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            acquired = entry[0].acquire(timeout=-1 if blocking_timeout is None else blocking_timeout)
+            if not acquired:
+                raise LockTimeout(f"获取锁超时: {name}")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._data_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[name]
+
+    def push(self, queue, value):
+        """把任务追加到队列末尾"""
+        with self._queue_cond:
+            self._queues[queue].append(value)
+            self._queue_cond.notify()
+
+    def pop(self, queue, timeout=None):
+        """
+        从队列头部取出任务，队列为空时最多等待 timeout 秒
+
+        Returns:
+            str: 任务内容，超时返回 None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue_cond:
+            while not self._queues[queue]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._queue_cond.wait(remaining)
+            return self._queues[queue].popleft()
+
+    def reserve(self, queue, worker_id, timeout=None):
+        """
+        从队列头部取出任务并移入该 worker 的处理中列表，处理完成后需调用 ack
+
+        Returns:
+            str: 任务内容，超时返回 None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue_cond:
+            while not self._queues[queue]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._queue_cond.wait(remaining)
+            value = self._queues[queue].popleft()
+            self._queues[_processing_key(queue, worker_id)].append(value)
+            return value
+
+    def ack(self, queue, worker_id, value):
+        """确认任务已处理完成，从处理中列表删除"""
+        with self._queue_cond:
+            try:
+                self._queues[_processing_key(queue, worker_id)].remove(value)
+            except ValueError:
+                pass
+
+    def heartbeat(self, queue, worker_id, ttl):
+        """登记 worker 并刷新心跳，心跳在 ttl 秒后过期"""
+        with self._data_lock:
+            self._workers[queue].add(worker_id)
+        self.set(_heartbeat_key(queue, worker_id), '1', ttl=ttl)
+
+    def requeue_stale(self, queue):
+        """
+        把心跳已过期（进程已退出）的 worker 处理中的任务放回队列
+
+        Returns:
+            int: 放回的任务数
+        """
+        requeued = 0
+        with self._data_lock:
+            workers = list(self._workers[queue])
+        for worker_id in workers:
+            if self.get(_heartbeat_key(queue, worker_id)) is not None:
+                continue
+            with self._queue_cond:
+                processing = self._queues.pop(_processing_key(queue, worker_id), deque())
+                self._queues[queue].extend(processing)
+                requeued += len(processing)
+                self._queue_cond.notify_all()
+            with self._data_lock:
+                self._workers[queue].discard(worker_id)
+        return requeued
+
+class RedisBackend:
+    """Redis 后端：多个节点共享缓存、锁和队列"""
+
+    def __init__(self, url, client=None):
+        """
+        Args:
+            url (str): Redis 连接地址，如 redis://localhost:6379/0
+            client: 可选的现成客户端（如 fakeredis.FakeRedis），用于测试
+        """
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise Exception("使用 Redis 后端需要安装 redis 模块: pip install redis")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    @contextmanager
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        """
+        分布式锁；timeout 为锁的自动过期时间，防止持有者崩溃后锁永远不释放
+
+        Raises:
+            LockTimeout: 超时未获取到锁
+        """
+        lock = self.client.lock(name, timeout=timeout, blocking_timeout=blocking_timeout)
+        if not lock.acquire():
+            raise LockTimeout(f"获取锁超时: {name}")
+        try:
+            yield
+        finally:
+            try:
+                lock.release()
+            except Exception:
+                # 锁已因过期被释放或被其他节点获取
+                pass
+
+    def push(self, queue, value):
+        self.client.lpush(queue, value)
+
+    def pop(self, queue, timeout=None):
+        # BRPOP 的 timeout 为 0 表示一直等待
+        item = self.client.brpop(queue, timeout=timeout or 0)
+        if item is None:
+            return None
+        value = item[1]
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def reserve(self, queue, worker_id, timeout=None):
+        # BRPOPLPUSH 原子地把任务移入处理中列表，worker 崩溃时任务不会丢失
+        value = self.client.brpoplpush(queue, _processing_key(queue, worker_id), timeout=timeout or 0)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def ack(self, queue, worker_id, value):
+        self.client.lrem(_processing_key(queue, worker_id), 1, value)
+
+    def heartbeat(self, queue, worker_id, ttl):
+        self.client.sadd(_workers_key(queue), worker_id)
+        self.client.set(_heartbeat_key(queue, worker_id), '1', ex=max(1, int(ttl)))
+
+    def requeue_stale(self, queue):
+        requeued = 0
+        for worker_id in self.client.smembers(_workers_key(queue)):
+            if isinstance(worker_id, bytes):
+                worker_id = worker_id.decode('utf-8')
+            if self.client.exists(_heartbeat_key(queue, worker_id)):
+                continue
+            # RPOPLPUSH 逐个原子移动，多个节点同时放回也不会重复
+            while self.client.rpoplpush(_processing_key(queue, worker_id), queue) is not None:
+                requeued += 1
+            self.client.srem(_workers_key(queue), worker_id)
+        return requeued
+
+def get_backend(url):
+    """
+    根据地址创建后端
+
+    Args:
+        url (str): '' 表示不使用共享后端，'memory://' 为进程内实现，'redis://' 或 'rediss://' 为 Redis
+
+    Returns:
+        MemoryBackend | RedisBackend | None
+    """
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise Exception(f"不支持的后端地址: {url}")
+
+# 共享任务队列名称，以及任务状态记录的键前缀
+JOB_QUEUE = "subtitle_jobs"
+JOB_KEY_PREFIX = "job:"
+
+def submit_job(backend, request_data, ttl=None):
+    """
+    把一个 /download-subtitle 请求放入共享任务队列，任意节点的 worker 都可以处理
+
+    Args:
+        backend: 共享后端
+        request_data (dict): 与 /download-subtitle 相同的请求参数
+        ttl (float): 任务状态记录的过期时间（秒）
+
+    Returns:
+        str: 任务 ID
+    """
+    job_id = uuid.uuid4().hex
+    update_job(backend, job_id, {"status": "queued", "url": request_data.get('url')}, ttl)
+    backend.push(JOB_QUEUE, json.dumps({"job_id": job_id, "request": request_data}, ensure_ascii=False))
+    return job_id
+
+def update_job(backend, job_id, record, ttl=None):
+    """写入任务状态记录（不包含请求中的 token 等敏感信息）"""
+    record = dict(record, job_id=job_id)
+    backend.set(JOB_KEY_PREFIX + job_id, json.dumps(record, ensure_ascii=False), ttl=ttl)
+
+def get_job(backend, job_id):
+    """
+    Returns:
+        dict: 任务状态记录，不存在时返回 None
+    """
+    record = backend.get(JOB_KEY_PREFIX + job_id)
+    return json.loads(record) if record is not None else None
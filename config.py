@@ -15,6 +15,64 @@ class Config:
     # 应用配置
     SUBTITLES_DIR = "subtitles"
     COOKIES_DIR = "cookies"
+    # Web 服务监听地址和端口
+    HOST = os.environ.get('HOST', '0.0.0.0')
+    PORT = int(os.environ.get('PORT', '5001'))
+    # 下载文件的 Cache-Control max-age（秒，0 表示每次都用 ETag 重新验证）
+    FILE_CACHE_MAX_AGE = int(os.environ.get('FILE_CACHE_MAX_AGE', '0'))
+    # 由前端服务器发送文件：X-Sendfile（Apache / lighttpd），或 nginx 的 internal location 前缀
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    X_ACCEL_REDIRECT_PREFIX = os.environ.get('X_ACCEL_REDIRECT_PREFIX', '')
+    
+    # 异步服务（async_server.py）：同时运行的 yt-dlp 进程数上限、到 Coze 的连接池大小
+    ASYNC_MAX_DOWNLOADS = int(os.environ.get('ASYNC_MAX_DOWNLOADS', '64'))
+    COZE_MAX_CONNECTIONS = int(os.environ.get('COZE_MAX_CONNECTIONS', '100'))
+    
+    # 流式处理：/download-subtitle 是否默认流式处理（请求中的 stream 参数优先），
+    # 以及清洗结果在内存中最多缓冲的字节数（超出后转存到临时文件）
+    STREAM_RESPONSES = os.environ.get('STREAM_RESPONSES', 'false').lower() == 'true'
+    SPOOL_MAX_SIZE = int(os.environ.get('SPOOL_MAX_SIZE', str(1024 * 1024)))
+    
+    # 日志配置：级别（DEBUG 时才输出完整载荷）和格式（text 或 json）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+    
+    # 直播字幕跟踪：轮询间隔（秒）和定期发送 Coze 摘要的间隔（秒，0 表示不发送）
+    LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', '5'))
+    LIVE_SUMMARY_INTERVAL = float(os.environ.get('LIVE_SUMMARY_INTERVAL', '0'))
+    
+    # 频道监视器：下载归档、高水位标记状态文件、检查间隔（秒，0 表示只检查一次）
+    WATCH_ARCHIVE_FILE = os.environ.get('WATCH_ARCHIVE_FILE', os.path.join(SUBTITLES_DIR, 'download_archive.txt'))
+    WATCH_STATE_FILE = os.environ.get('WATCH_STATE_FILE', os.path.join(SUBTITLES_DIR, 'watch_state.json'))
+    WATCH_INTERVAL = float(os.environ.get('WATCH_INTERVAL', '0'))
+    # 首次检查一个频道时最多处理的视频数、之后每次检查最多列出的视频数
+    WATCH_INITIAL_LIMIT = int(os.environ.get('WATCH_INITIAL_LIMIT', '20'))
+    WATCH_MAX_PER_POLL = int(os.environ.get('WATCH_MAX_PER_POLL', '200'))
+    # 同一视频最多尝试的次数，超过后不再自动重试（如私享、会员专属或没有字幕的视频）
+    WATCH_MAX_ATTEMPTS = int(os.environ.get('WATCH_MAX_ATTEMPTS', '3'))
+    
+    # 共享后端：留空只使用本地文件，memory:// 为进程内实现，redis://host:6379/0 供多个节点共享
+    BACKEND_URL = os.environ.get('BACKEND_URL', '')
+    # 字幕和 Coze 结果缓存的过期时间（秒），单飞锁的最长持有和等待时间（秒）
+    CACHE_TTL = int(os.environ.get('CACHE_TTL', str(7 * 24 * 3600)))
+    LOCK_TIMEOUT = int(os.environ.get('LOCK_TIMEOUT', '600'))
+    # Web 服务进程内处理共享任务队列的 worker 线程数
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', '0'))
+    # worker 心跳的过期时间（秒），worker 退出后超过该时间，其未完成的任务会被放回队列
+    WORKER_HEARTBEAT_TTL = int(os.environ.get('WORKER_HEARTBEAT_TTL', '30'))
+    
+    # 列式导出：输出目录、默认格式（parquet 或 arrow）、每批最多行数
+    EXPORT_DIR = os.environ.get('EXPORT_DIR', 'exports')
+    EXPORT_FORMAT = os.environ.get('EXPORT_FORMAT', 'parquet')
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '50000'))
+    
+    # 性能分析：随机采样的请求比例（0~1）、采样间隔（毫秒）、结果保存目录和最多保留的结果数
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '200'))
+    # 管理接口和 X-Profile 请求头使用的令牌，留空时两者均不可用
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
     
     @classmethod
     def is_coze_configured(cls):
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试共用的 fixture：在 loadtest.write_stub_ytdlp 的假 yt-dlp 外面包一层只供测试使用的开关
+"""
+
+import os
+import stat
+import sys
+
+import pytest
+
+from loadtest import write_stub_ytdlp
+
+# 包装脚本：处理测试专用的开关，下载本身交给压测工具的假 yt-dlp
+TEST_YTDLP = '''\
+#!{python}
+"""测试用 yt-dlp：处理 FAKE_YTDLP_PLAYLIST / FAIL_MARKER / VTT / CALLS，其余交给 {stub}"""
+import os, subprocess, sys
+
+args = sys.argv[1:]
+if "--flat-playlist" in args:
+    # 列出频道：按从新到旧输出 FAKE_YTDLP_PLAYLIST 文件中的视频 ID
+    with open(os.environ["FAKE_YTDLP_PLAYLIST"], encoding="utf-8") as f:
+        for line in f:
+            print(line.strip(), flush=True)
+    sys.exit(0)
+
+url = args[-1]
+fail_marker = os.environ.get("FAKE_YTDLP_FAIL_MARKER")
+if fail_marker and fail_marker in url:
+    sys.stderr.write("ERROR: Video unavailable")
+    sys.exit(1)
+
+result = subprocess.run([{stub!r}] + args)
+if result.returncode != 0:
+    sys.exit(result.returncode)
+
+content = os.environ.get("FAKE_YTDLP_VTT")
+if content is not None:
+    # 与压测替身使用相同的输出路径，覆盖它生成的字幕内容
+    output = args[args.index("-o") + 1] if "-o" in args else "%(title)s.%(ext)s"
+    video_id = url.rsplit("=", 1)[-1]
+    lang = next((a.split("=", 1)[1] for a in args if a.startswith("--sub-lang=")), "en")
+    path = os.path.join(os.path.dirname(output) or ".", video_id + "." + lang + ".vtt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content.replace("{{video_id}}", video_id))
+
+calls = os.environ.get("FAKE_YTDLP_CALLS")
+if calls:
+    with open(calls, "a", encoding="utf-8") as f:
+        f.write(url + "\\n")
+'''
+
+# 压测替身本身的开关（FAKE_YTDLP_DELAY / CUES / ERROR_RATE）和上面测试专用的开关
+FAKE_YTDLP_KNOBS = ("DELAY", "CUES", "ERROR_RATE", "VTT", "FAIL_MARKER", "CALLS", "PLAYLIST")
+
+def write_test_ytdlp(bin_dir, stub_dir):
+    """
+    在 stub_dir 中写入压测工具的假 yt-dlp，在 bin_dir 中写入调用它的测试包装脚本
+
+    除 loadtest.write_stub_ytdlp 的开关外，还支持：
+    FAKE_YTDLP_VTT（直接写出的字幕内容，{video_id} 会被替换为视频 ID）、
+    FAKE_YTDLP_FAIL_MARKER（链接中包含该字符串时下载失败）、
+    FAKE_YTDLP_CALLS（记录成功下载的视频链接的文件）、
+    FAKE_YTDLP_PLAYLIST（--flat-playlist 时输出的视频 ID 列表文件）
+
+    Returns:
+        str: 包装脚本路径
+    """
+    stub = write_stub_ytdlp(stub_dir)
+    path = os.path.join(bin_dir, "yt-dlp")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(TEST_YTDLP.format(python=sys.executable, stub=stub))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+class FakeYtdlp:
+    """控制 PATH 中假 yt-dlp 的行为，并读取它的调用记录"""
+
+    def __init__(self, monkeypatch, calls_file):
+        self._monkeypatch = monkeypatch
+        self.calls_file = calls_file
+
+    def configure(self, **knobs):
+        """
+        设置环境变量 FAKE_YTDLP_<名称>，如 configure(delay=0.2, vtt="WEBVTT ...")
+        可用的名称见 FAKE_YTDLP_KNOBS
+        """
+        for name, value in knobs.items():
+            self._monkeypatch.setenv(f"FAKE_YTDLP_{name.upper()}", str(value))
+
+    def calls(self):
+        """
+        Returns:
+            list: 成功下载过的视频链接，按调用顺序
+        """
+        if not os.path.exists(self.calls_file):
+            return []
+        with open(self.calls_file, encoding="utf-8") as f:
+            return f.read().split()
+
+@pytest.fixture
+def fake_ytdlp(tmp_path, monkeypatch):
+    """把测试用的假 yt-dlp 放到 PATH 最前面，返回 FakeYtdlp"""
+    bin_dir, stub_dir = tmp_path / "fake-bin", tmp_path / "loadtest-bin"
+    bin_dir.mkdir()
+    stub_dir.mkdir()
+    write_test_ytdlp(str(bin_dir), str(stub_dir))
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    for knob in FAKE_YTDLP_KNOBS:
+        monkeypatch.delenv(f"FAKE_YTDLP_{knob}", raising=False)
+    fake = FakeYtdlp(monkeypatch, str(tmp_path / "ytdlp_calls.txt"))
+    fake.configure(calls=fake.calls_file)
+    return fake
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+把 SUBTITLES_DIR 中保存的字幕和 Coze 摘要批量导出为压缩的列式格式（Parquet 或 Arrow IPC）
+
+- cues 表：每个字幕块一行（video_id, lang, start_ms, end_ms, text, run_id）
+- videos 表：每个视频一行摘要（字幕块数、时长、字符数、Coze 摘要等，以及 run_id）
+
+按批写出，内存占用只与批大小有关。命令行模式是增量的：记录每个字幕文件上次导出时的
+大小和修改时间，之后只导出新增或变化的文件，每次运行在 EXPORT_DIR/cues/ 和
+EXPORT_DIR/videos/ 中各写出新的分片文件，每个目录可以直接作为一个数据集读取。
+变化的字幕会整体重新导出，旧的行仍留在之前的分片中，读取时按 (video_id, lang)
+只保留 run_id 最大的行即可去重（run_id 以导出时间开头，按字符串排序即按时间排序）。
+
+需要安装 pyarrow: pip install pyarrow
+"""
+
+import json
+import os
+import re
+import sys
+import uuid
+from datetime import datetime
+
+from config import Config
+from vtt import iter_cues
+
+# 文件名格式为 "标题 [视频ID].语言.vtt"（yt-dlp 默认输出模板）
+VIDEO_ID_PATTERN = re.compile(r'\[([\w-]+)\]$')
+FORMATS = ('parquet', 'arrow')
+TABLES = ('cues', 'videos')
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("导出需要安装 pyarrow 模块: pip install pyarrow")
+    return pyarrow
+
+def schemas():
+    """
+    Returns:
+        dict: {表名: pyarrow.Schema}
+    """
+    pa = _pyarrow()
+    return {
+        "cues": pa.schema([
+            ("video_id", pa.string()),
+            ("lang", pa.string()),
+            ("start_ms", pa.int64()),
+            ("end_ms", pa.int64()),
+            ("text", pa.string()),
+            ("run_id", pa.string()),
+        ]),
+        "videos": pa.schema([
+            ("video_id", pa.string()),
+            ("lang", pa.string()),
+            ("subtitle_file", pa.string()),
+            ("cue_count", pa.int64()),
+            ("duration_ms", pa.int64()),
+            ("char_count", pa.int64()),
+            ("summary", pa.string()),
+            ("modified_at", pa.timestamp('s')),
+            ("run_id", pa.string()),
+        ]),
+    }
+
+def parse_subtitle_name(file_name):
+    """
+    从字幕文件名中解析视频 ID 和语言
+
+    Returns:
+        tuple: (video_id, lang)；旧文件名中没有 [视频ID] 时以标题作为 video_id
+    """
+    stem = file_name[:-len('.vtt')] if file_name.endswith('.vtt') else file_name
+    if '.' in stem:
+        stem, lang = stem.rsplit('.', 1)
+    else:
+        lang = ''
+    match = VIDEO_ID_PATTERN.search(stem)
+    return (match.group(1) if match else stem), lang
+
+def iter_subtitle_files(directory, exported=None):
+    """
+    列出需要导出的字幕文件
+
+    Args:
+        directory (str): 字幕目录
+        exported (dict): {文件名: export_fingerprint 的结果}，与之相同的文件会被跳过
+
+    Yields:
+        tuple: (文件名, os.stat_result)
+    """
+    exported = exported or {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith('.vtt'):
+                continue
+            stat = entry.stat()
+            if exported and exported.get(entry.name) == export_fingerprint(directory, entry.name, stat):
+                continue
+            yield entry.name, stat
+
+def export_fingerprint(directory, file_name, stat):
+    """
+    记录在导出状态中的文件指纹
+
+    Coze 摘要（_coze_result.md）通常在字幕下载之后才写出，指纹同时包含它的状态，
+    摘要出现或变化时会重新导出该字幕。
+
+    Returns:
+        list: [字幕大小, 字幕修改时间纳秒, 摘要大小, 摘要修改时间纳秒]，没有摘要时后两项为 None
+    """
+    try:
+        summary_stat = os.stat(_summary_path(directory, file_name))
+    except FileNotFoundError:
+        return [stat.st_size, stat.st_mtime_ns, None, None]
+    return [stat.st_size, stat.st_mtime_ns, summary_stat.st_size, summary_stat.st_mtime_ns]
+
+def new_run_id():
+    """
+    Returns:
+        str: 本次导出的 ID，以精确到微秒的导出时间开头，按字符串排序即按导出先后排序
+    """
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+def _summary_path(directory, file_name):
+    return os.path.join(directory, os.path.splitext(file_name)[0] + '_coze_result.md')
+
+def _read_summary(directory, file_name):
+    md_file = _summary_path(directory, file_name)
+    if not os.path.exists(md_file):
+        return None
+    with open(md_file, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def iter_record_batches(directory, files, batch_size=None, run_id=None):
+    """
+    逐个文件流式解析字幕，按批产出 RecordBatch
+
+    Args:
+        directory (str): 字幕目录
+        files (iterable): (文件名, os.stat_result)
+        batch_size (int): 每批最多的行数
+        run_id (str): 写入每一行的导出 ID，默认新生成一个
+
+    Yields:
+        tuple: (表名, pyarrow.RecordBatch)
+    """
+    pa = _pyarrow()
+    batch_size = batch_size or Config.EXPORT_BATCH_SIZE
+    run_id = run_id or new_run_id()
+    table_schemas = schemas()
+    columns = {name: {field.name: [] for field in schema} for name, schema in table_schemas.items()}
+    counts = {name: 0 for name in TABLES}
+
+    def flush(name):
+        batch = pa.RecordBatch.from_pydict(columns[name], schema=table_schemas[name])
+        for values in columns[name].values():
+            values.clear()
+        counts[name] = 0
+        return name, batch
+
+    for file_name, stat in files:
+        video_id, lang = parse_subtitle_name(file_name)
+        cue_count = char_count = duration_ms = 0
+        cues = columns["cues"]
+        with open(os.path.join(directory, file_name), 'r', encoding='utf-8') as f:
+            for start_ms, end_ms, text in iter_cues(f):
+                cues["video_id"].append(video_id)
+                cues["lang"].append(lang)
+                cues["start_ms"].append(start_ms)
+                cues["end_ms"].append(end_ms)
+                cues["text"].append(text)
+                cues["run_id"].append(run_id)
+                cue_count += 1
+                char_count += len(text)
+                duration_ms = max(duration_ms, end_ms)
+                counts["cues"] += 1
+                if counts["cues"] >= batch_size:
+                    yield flush("cues")
+
+        videos = columns["videos"]
+        videos["video_id"].append(video_id)
+        videos["lang"].append(lang)
+        videos["subtitle_file"].append(file_name)
+        videos["cue_count"].append(cue_count)
+        videos["duration_ms"].append(duration_ms)
+        videos["char_count"].append(char_count)
+        videos["summary"].append(_read_summary(directory, file_name))
+        videos["modified_at"].append(int(stat.st_mtime))
+        videos["run_id"].append(run_id)
+        counts["videos"] += 1
+        if counts["videos"] >= batch_size:
+            yield flush("videos")
+
+    for name in TABLES:
+        if counts[name]:
+            yield flush(name)
+
+def open_writer(sink, schema, fmt):
+    """
+    创建压缩的列式写入器
+
+    Args:
+        sink: 文件路径或可写的文件对象
+        schema: pyarrow.Schema
+        fmt (str): 'parquet'（zstd 压缩）或 'arrow'（Arrow IPC 流格式，zstd 压缩）
+    """
+    pa = _pyarrow()
+    if fmt == 'parquet':
+        return pa.parquet.ParquetWriter(sink, schema, compression='zstd')
+    if fmt == 'arrow':
+        return pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    raise Exception(f"不支持的导出格式: {fmt}")
+
+class _ChunkSink:
+    """收集写入的字节，供 HTTP 响应按块取走"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_export(directory, table='cues', fmt='arrow', since=None, batch_size=None):
+    """
+    以生成器形式流式输出一张表，每写完一批就产出对应的字节，适合直接作为 HTTP 响应体
+
+    Args:
+        directory (str): 字幕目录
+        table (str): 'cues' 或 'videos'
+        fmt (str): 'arrow' 或 'parquet'
+        since (float): 只导出修改时间晚于该 Unix 时间戳的字幕文件
+        batch_size (int): 每批最多的行数
+
+    Yields:
+        bytes: 导出文件内容的片段
+    """
+    pa = _pyarrow()
+    if table not in TABLES:
+        raise Exception(f"不支持的表: {table}")
+    schema = schemas()[table]
+    files = (
+        (name, stat) for name, stat in iter_subtitle_files(directory)
+        if since is None or stat.st_mtime > since
+    )
+    sink = _ChunkSink()
+    writer = open_writer(pa.PythonFile(sink, mode='w'), schema, fmt)
+    for name, batch in iter_record_batches(directory, files, batch_size):
+        if name != table:
+            continue
+        writer.write_batch(batch)
+        data = sink.take()
+        if data:
+            yield data
+    writer.close()
+    yield sink.take()
+
+def export_incremental(directory=None, out_dir=None, fmt=None, state_file=None, batch_size=None):
+    """
+    增量导出：只导出上次运行之后新增或变化的字幕文件，写出新的分片文件
+
+    Args:
+        directory (str): 字幕目录，默认为 Config.SUBTITLES_DIR
+        out_dir (str): 输出目录，默认为 Config.EXPORT_DIR
+        fmt (str): 'parquet' 或 'arrow'，默认为 Config.EXPORT_FORMAT
+        state_file (str): 导出状态文件，默认为 out_dir/_export_state.json（以 _ 开头，读取数据集时会被忽略）
+        batch_size (int): 每批最多的行数
+
+    Returns:
+        dict: 本次导出的文件数、行数和输出文件路径
+    """
+    directory = directory or Config.SUBTITLES_DIR
+    out_dir = out_dir or Config.EXPORT_DIR
+    fmt = fmt or Config.EXPORT_FORMAT
+    state_file = state_file or os.path.join(out_dir, '_export_state.json')
+    os.makedirs(out_dir, exist_ok=True)
+
+    state = {"files": {}}
+    if os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+    files = list(iter_subtitle_files(directory, state["files"]))
+    # 在读取内容之前记录指纹，读取期间才写出的摘要会在下次导出时补上
+    fingerprints = {name: export_fingerprint(directory, name, stat) for name, stat in files}
+    stats = {"files": len(files), "rows": {name: 0 for name in TABLES}, "outputs": []}
+    if not files:
+        return stats
+
+    # 每张表写到各自的子目录，分片文件名带本次导出 ID，读取时把子目录当作一个数据集
+    run_id = new_run_id()
+    extension = 'parquet' if fmt == 'parquet' else 'arrows'
+    table_schemas = schemas()
+    writers = {}
+    try:
+        for name, batch in iter_record_batches(directory, files, batch_size, run_id):
+            if name not in writers:
+                table_dir = os.path.join(out_dir, name)
+                os.makedirs(table_dir, exist_ok=True)
+                path = os.path.join(table_dir, f"{name}-{run_id}.{extension}")
+                if os.path.exists(path):
+                    raise Exception(f"导出文件已存在: {path}")
+                writers[name] = open_writer(path, table_schemas[name], fmt)
+                stats["outputs"].append(path)
+            writers[name].write_batch(batch)
+            stats["rows"][name] += batch.num_rows
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    state["files"].update(fingerprints)
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_file, state_file)
+    return stats
+
+def main():
+    """
+    命令行模式：python export.py [parquet|arrow]
+    把新增的字幕增量导出到 EXPORT_DIR
+    """
+    fmt = sys.argv[1] if len(sys.argv) > 1 else Config.EXPORT_FORMAT
+    if fmt not in FORMATS:
+        print(f"用法: python export.py [{'|'.join(FORMATS)}]")
+        sys.exit(1)
+    try:
+        stats = export_incremental(fmt=fmt)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    if not stats["files"]:
+        print("没有新的字幕需要导出")
+        return
+    print(f"已导出 {stats['files']} 个字幕文件: "
+          f"{stats['rows']['cues']} 个字幕块, {stats['rows']['videos']} 个视频")
+    for path in stats["outputs"]:
+        print(f"  {path}")
+
+if __name__ == '__main__':
+    main()
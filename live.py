@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+直播 / 首映字幕实时跟踪
+功能：
+1. 持续拉取新的字幕分段（HLS 字幕播放列表、可增量读取的 HTTP 文件或本地增长的 VTT 文件）
+2. 只对新到达的字幕块做增量清洗，并跨分段保留滚动去重状态
+3. 把新增文本推送给订阅者，可选地定期把当前全文发送到 Coze 生成摘要
+
+每次更新的开销只与新增文本成正比，不会重新处理整个直播的字幕。
+"""
+
+import codecs
+import json
+import subprocess
+import sys
+import time
+from urllib.parse import urljoin
+
+import requests
+
+from config import Config
+from logging_utils import get_logger, configure_logging, summarize_text, lazy
+from main import _is_subtitle_text_line, send_to_coze_workflow
+from vtt import parse_cue_timing, clean_cue_text
+
+logger = get_logger("live")
+
+# 拉取字幕出错时重试的最长间隔（秒）
+MAX_RETRY_INTERVAL = 60
+
+class IncrementalSubtitleCleaner:
+    """
+    增量字幕清洗器
+
+    每次 feed 只解析新到达的完整字幕块，未结束的字幕块留在缓冲区等待后续数据。
+    自动字幕会在相邻字幕块中重复上一行（滚动显示），这里只和上一个字幕块的文本行比较去重，
+    不相邻的字幕块中合法重复的短句（如 "yes"）仍会保留；
+    并跳过起始时间早于已处理字幕块的重放内容（分段重叠时会出现）。
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._previous_lines = set()
+        self._last_start_ms = -1
+
+    def feed(self, chunk, final=False):
+        """
+        输入一段新的字幕数据
+
+        Args:
+            chunk (str): 新追加的 VTT 文本（可以是完整分段，也可以在字幕块中间截断）
+            final (bool): 是否为最后一段，为 True 时缓冲区中剩余的字幕块也会被处理
+
+        Returns:
+            list: 新增的清洗后文本行
+        """
+        self._buffer += chunk.replace('\r\n', '\n')
+        blocks = self._buffer.split('\n\n')
+        if final:
+            self._buffer = ''
+        else:
+            # 最后一块可能还没接收完整，留到下次处理
+            self._buffer = blocks.pop()
+
+        new_lines = []
+        for block in blocks:
+            new_lines.extend(self._process_block(block))
+        return new_lines
+
+    def flush(self):
+        """处理缓冲区中剩余的数据（流结束时调用）"""
+        return self.feed('', final=True)
+
+    def _process_block(self, block):
+        lines = block.strip('\n').split('\n')
+        # 找到时间戳行，之前的内容（WEBVTT 头、cue 编号、NOTE/STYLE 块）都忽略
+        # 直播分段中的时间戳可能省略小时部分
+        for index, line in enumerate(lines):
+            timing = parse_cue_timing(line.strip())
+            if timing:
+                break
+        else:
+            return []
+
+        start_ms = timing[0]
+        if start_ms < self._last_start_ms:
+            # 分段重叠导致的重放字幕块
+            return []
+        self._last_start_ms = start_ms
+
+        cue_lines = []
+        cleaned = []
+        for line in lines[index + 1:]:
+            stripped = line.strip()
+            if not _is_subtitle_text_line(stripped):
+                continue
+            text = clean_cue_text(stripped)
+            if not text:
+                continue
+            cue_lines.append(text)
+            # 只跳过上一个字幕块中已显示的行（滚动显示的重复），以及本块内的重复行
+            if text in self._previous_lines or text in cleaned:
+                continue
+            cleaned.append(text)
+        self._previous_lines = set(cue_lines)
+        return cleaned
+
+class FileTailSource:
+    """读取本地不断增长的 VTT 文件中新追加的部分"""
+
+    def __init__(self, path):
+        self.path = path
+        self.ended = False
+        self._offset = 0
+        # 增量解码，避免多字节字符被截断在两次读取之间
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def read_new(self):
+        """
+        Returns:
+            str: 自上次读取以来追加的文本，文件不存在时返回空字符串
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return ''
+        self._offset += len(data)
+        return self._decoder.decode(data)
+
+class HttpTailSource:
+    """
+    轮询一个不断增长的远程字幕文件，通过 Range 请求只下载新增字节
+
+    服务器不支持 Range 时会返回完整内容，此时丢弃已读取过的前缀。
+    """
+
+    def __init__(self, url, session=None):
+        self.url = url
+        self.ended = False
+        self._session = session or requests.Session()
+        self._offset = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def read_new(self):
+        headers = {'Range': f'bytes={self._offset}-'} if self._offset else {}
+        response = self._session.get(self.url, headers=headers, timeout=30)
+        if response.status_code == 416:
+            return ''
+        response.raise_for_status()
+        data = response.content
+        if response.status_code != 206:
+            data = data[self._offset:]
+        self._offset += len(data)
+        return self._decoder.decode(data)
+
+class HlsSubtitleSource:
+    """
+    轮询 HLS 字幕播放列表（m3u8），只下载尚未获取过的 VTT 分段
+
+    通过 EXT-X-MEDIA-SEQUENCE 记录已处理到的分段序号，状态大小与直播时长无关。
+    播放列表出现 EXT-X-ENDLIST 时认为直播结束。
+    """
+
+    def __init__(self, playlist_url, session=None):
+        self.playlist_url = playlist_url
+        self.ended = False
+        self._session = session or requests.Session()
+        self._next_sequence = None
+
+    def read_new(self):
+        response = self._session.get(self.playlist_url, timeout=30)
+        response.raise_for_status()
+
+        media_sequence = 0
+        segments = []
+        for line in response.text.splitlines():
+            line = line.strip()
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                media_sequence = int(line.split(':', 1)[1])
+            elif line == '#EXT-X-ENDLIST':
+                self.ended = True
+            elif line and not line.startswith('#'):
+                segments.append(line)
+
+        if self._next_sequence is None:
+            self._next_sequence = media_sequence
+
+        chunks = []
+        for offset, uri in enumerate(segments):
+            sequence = media_sequence + offset
+            if sequence < self._next_sequence:
+                continue
+            try:
+                segment = self._session.get(urljoin(self.playlist_url, uri), timeout=30)
+                segment.raise_for_status()
+            except requests.RequestException:
+                if not chunks:
+                    raise
+                # 先返回已下载的分段，失败的分段在下次轮询时重试
+                logger.warning("下载字幕分段 %d 失败，下次轮询重试", sequence, exc_info=True)
+                break
+            # 每个分段都是独立的 VTT 文件，用空行分隔保证字幕块边界
+            chunks.append(segment.content.decode('utf-8') + '\n\n')
+            self._next_sequence = sequence + 1
+        return ''.join(chunks)
+
+def resolve_live_subtitle_url(url, lang='en', browser=None, cookies_file=None):
+    """
+    通过 yt-dlp 获取直播字幕地址（不下载视频）
+
+    Args:
+        url (str): YouTube 直播 / 首映链接
+        lang (str): 字幕语言，默认为 'en'
+        browser (str): 浏览器名称，用于获取 cookies
+        cookies_file (str): cookies 文件路径
+
+    Returns:
+        tuple: (字幕地址, 是否为 HLS 播放列表)
+    """
+    cmd = ["yt-dlp", "--dump-single-json", "--skip-download"]
+    if browser:
+        cmd.extend(["--cookies-from-browser", browser])
+    elif cookies_file:
+        cmd.extend(["--cookies", cookies_file])
+    cmd.append(url)
+
+    logger.debug("执行命令: %s", lazy(' '.join, cmd))
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"获取直播信息失败: {result.stderr.strip()}")
+
+    info = json.loads(result.stdout)
+    for key in ('subtitles', 'automatic_captions'):
+        formats = (info.get(key) or {}).get(lang) or []
+        # 优先使用 HLS 字幕分段，其次是 VTT 文件
+        for fmt in formats:
+            if 'm3u8' in (fmt.get('protocol') or '') or fmt.get('ext') == 'm3u8':
+                return fmt['url'], True
+        for fmt in formats:
+            if fmt.get('ext') == 'vtt':
+                return fmt['url'], False
+    raise Exception(f"未找到语言为 {lang} 的直播字幕")
+
+class LiveSubtitleTail:
+    """
+    直播字幕跟踪器：从 source 拉取新分段，增量清洗后推送给订阅者
+
+    source 需要提供 read_new() 方法（返回新增的 VTT 文本）和 ended 属性。
+    """
+
+    def __init__(self, source, poll_interval=5.0, summary_interval=None,
+                 workflow_id=None, token=None):
+        """
+        Args:
+            source: 字幕分段来源，如 HlsSubtitleSource、HttpTailSource、FileTailSource
+            poll_interval (float): 轮询间隔（秒）
+            summary_interval (float): 定期发送 Coze 摘要的间隔（秒），None 表示不发送
+            workflow_id (str): Coze 工作流 ID，默认使用 Config 中的值
+            token (str): Coze API Token，默认使用 Config 中的值
+        """
+        self.source = source
+        self.poll_interval = poll_interval
+        self.summary_interval = summary_interval
+        self.workflow_id = workflow_id if workflow_id is not None else Config.COZE_WORKFLOW_ID
+        self.token = token if token is not None else Config.COZE_TOKEN
+        self.cleaner = IncrementalSubtitleCleaner()
+        self._parts = []
+        self._subscribers = []
+        self._summary_subscribers = []
+        self._last_summary_at = time.monotonic()
+        self._summarized_parts = 0
+        self._session = None
+
+    def subscribe(self, callback):
+        """注册新增文本的回调，callback(text)"""
+        self._subscribers.append(callback)
+
+    def subscribe_summary(self, callback):
+        """注册 Coze 摘要的回调，callback(coze_response)"""
+        self._summary_subscribers.append(callback)
+
+    @property
+    def transcript(self):
+        """目前为止的完整清洗后文本"""
+        return ' '.join(self._parts)
+
+    def poll_once(self, final=False):
+        """
+        拉取并处理一次新数据
+
+        Args:
+            final (bool): 是否为最后一次（流结束），会清空清洗器缓冲区
+
+        Returns:
+            str: 本次新增的文本，没有新内容时返回空字符串
+        """
+        chunk = self.source.read_new()
+        return self._emit(self.cleaner.feed(chunk, final=final))
+
+    def _emit(self, lines):
+        if not lines:
+            return ''
+        text = ' '.join(lines)
+        self._parts.append(text)
+        logger.debug("直播字幕新增: %s", lazy(summarize_text, text))
+        self._notify(self._subscribers, text)
+        return text
+
+    def run(self, stop_event=None):
+        """
+        持续轮询直到直播结束或 stop_event 被设置
+
+        Args:
+            stop_event (threading.Event): 可选的停止信号
+
+        Returns:
+            str: 完整的清洗后文本
+        """
+        failures = 0
+        while True:
+            stopped = stop_event is not None and stop_event.is_set()
+            try:
+                self.poll_once(final=stopped)
+                failures = 0
+            except Exception:
+                # 临时的网络错误或 5xx 不结束跟踪：保留清洗器和分段序号状态，退避后重试
+                failures += 1
+                logger.exception("拉取直播字幕失败（连续 %d 次），稍后重试", failures)
+            if stopped or (self.source.ended and not failures):
+                # 处理缓冲区中最后一个字幕块，并对完整文本做最后一次摘要
+                self._emit(self.cleaner.flush())
+                self._maybe_summarize(force=True)
+                break
+            self._maybe_summarize()
+            interval = self.poll_interval
+            if failures:
+                interval = min(self.poll_interval * 2 ** failures, max(MAX_RETRY_INTERVAL, self.poll_interval))
+            if stop_event is not None:
+                stop_event.wait(interval)
+            else:
+                time.sleep(interval)
+        if self._session is not None:
+            self._session.close()
+        return self.transcript
+
+    def _maybe_summarize(self, force=False):
+        if not self.summary_interval or not (self.workflow_id and self.token):
+            return
+        if len(self._parts) == self._summarized_parts:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_summary_at < self.summary_interval:
+            return
+
+        self._last_summary_at = now
+        self._summarized_parts = len(self._parts)
+        if self._session is None:
+            self._session = requests.Session()
+        try:
+            coze_response = send_to_coze_workflow(
+                self.workflow_id, self.token, self.transcript, 'live', session=self._session
+            )
+        except Exception as e:
+            logger.warning("直播摘要发送到 Coze 失败: %s", e)
+            return
+        self._notify(self._summary_subscribers, coze_response)
+
+    @staticmethod
+    def _notify(callbacks, value):
+        for callback in callbacks:
+            try:
+                callback(value)
+            except Exception:
+                logger.exception("直播字幕订阅者回调出错")
+
+def main():
+    """
+    命令行模式：python live.py <直播链接> [语言]
+    新增文本实时输出到标准输出，Coze 已配置且设置了 LIVE_SUMMARY_INTERVAL 时定期输出摘要
+    """
+    if len(sys.argv) < 2:
+        print("用法: python live.py <直播链接> [语言]")
+        sys.exit(1)
+
+    Config.load_from_file()
+    configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT)
+    url = sys.argv[1]
+    lang = sys.argv[2] if len(sys.argv) > 2 else 'en'
+
+    subtitle_url, is_hls = resolve_live_subtitle_url(url, lang)
+    source = HlsSubtitleSource(subtitle_url) if is_hls else HttpTailSource(subtitle_url)
+    tail = LiveSubtitleTail(
+        source,
+        poll_interval=Config.LIVE_POLL_INTERVAL,
+        summary_interval=Config.LIVE_SUMMARY_INTERVAL
+    )
+    tail.subscribe(lambda text: print(text, flush=True))
+    tail.subscribe_summary(
+        lambda response: print(f"\n[Coze 摘要]\n{json.dumps(response, ensure_ascii=False)}\n", flush=True)
+    )
+    try:
+        tail.run()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+离线压测工具：不访问 YouTube 和 Coze，测量 /download-subtitle 的吞吐量和延迟
+功能：
+1. 生成假的 yt-dlp 可执行文件，按配置的延迟输出指定数量字幕块的 VTT
+2. 启动本地 Coze 桩服务，可配置响应延迟和错误率
+3. 在子进程中启动 Web 服务（使用上面两个替身），并发发送请求
+4. 按场景输出吞吐量、p50/p95/p99 延迟和错误率
+
+用法:
+    python loadtest.py                       # 运行所有内置场景
+    python loadtest.py --scenario baseline   # 只运行指定场景
+    python loadtest.py --concurrency 32 --requests 500 --coze-latency 0.5
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 被压测的服务启动命令，{python} 和 {project} 会被替换
+SERVER_COMMANDS = {
+    "flask": ["{python}", "{project}/main.py"],
+    "async": ["{python}", "{project}/async_server.py"],
+}
+
+# 内置场景：并发数、请求数、yt-dlp 延迟（秒）、字幕块数量、Coze 延迟（秒）、错误率
+SCENARIOS = {
+    "baseline": {
+        "concurrency": 8, "requests": 100,
+        "ytdlp_delay": 0.2, "cues": 200, "ytdlp_error_rate": 0.0,
+        "coze_latency": 0.2, "coze_error_rate": 0.0,
+    },
+    "slow-coze": {
+        "concurrency": 32, "requests": 200,
+        "ytdlp_delay": 0.2, "cues": 200, "ytdlp_error_rate": 0.0,
+        "coze_latency": 2.0, "coze_error_rate": 0.0,
+    },
+    "long-transcript": {
+        "concurrency": 8, "requests": 50,
+        "ytdlp_delay": 0.2, "cues": 20000, "ytdlp_error_rate": 0.0,
+        "coze_latency": 0.2, "coze_error_rate": 0.0,
+    },
+    "flaky": {
+        "concurrency": 16, "requests": 200,
+        "ytdlp_delay": 0.2, "cues": 200, "ytdlp_error_rate": 0.05,
+        "coze_latency": 0.2, "coze_error_rate": 0.1,
+    },
+}
+
+STUB_YTDLP = '''\
+#!{python}
+"""假的 yt-dlp：按环境变量配置的延迟写出 VTT 字幕文件"""
+import os, random, sys, time
+
+args = sys.argv[1:]
+time.sleep(float(os.environ.get("FAKE_YTDLP_DELAY", "0")))
+if random.random() < float(os.environ.get("FAKE_YTDLP_ERROR_RATE", "0")):
+    sys.stderr.write("ERROR: stub yt-dlp failure")
+    sys.exit(1)
+
+output = args[args.index("-o") + 1] if "-o" in args else "%(title)s.%(ext)s"
+video_id = args[-1].rsplit("=", 1)[-1]
+lang = next((a.split("=", 1)[1] for a in args if a.startswith("--sub-lang=")), "en")
+path = os.path.join(os.path.dirname(output) or ".", f"{{video_id}}.{{lang}}.vtt")
+
+cues = int(os.environ.get("FAKE_YTDLP_CUES", "100"))
+with open(path, "w", encoding="utf-8") as f:
+    f.write("WEBVTT\\nKind: captions\\nLanguage: " + lang + "\\n\\n")
+    for i in range(cues):
+        start, end = i * 2, i * 2 + 2
+        f.write(f"00:{{start // 60 % 60:02d}}:{{start % 60:02d}}.000 --> "
+                f"00:{{end // 60 % 60:02d}}:{{end % 60:02d}}.000\\n")
+        f.write(f"cue {{i}} of video {{video_id}} with some&nbsp;\\nwrapped caption text\\n\\n")
+'''
+
+def write_stub_ytdlp(bin_dir):
+    """
+    在 bin_dir 中写入假的 yt-dlp，行为由环境变量控制：
+    FAKE_YTDLP_DELAY（秒）、FAKE_YTDLP_CUES（字幕块数量）、FAKE_YTDLP_ERROR_RATE（0~1）
+
+    Returns:
+        str: 可执行文件路径
+    """
+    path = os.path.join(bin_dir, "yt-dlp")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(STUB_YTDLP.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    return path
+
+def free_port():
+    """获取一个空闲的本地端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class CozeStubServer:
+    """
+    本地 Coze 工作流桩服务：按配置的延迟返回摘要，按错误率返回 500
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                stub.requests += 1
+                time.sleep(stub.latency)
+                if random.random() < stub.error_rate:
+                    self._reply(500, {"code": 5000, "msg": "stub error"})
+                    return
+                subtitle = payload.get("parameters", {}).get("subtitle", "")
+                summary = f"# 摘要\n\n字幕长度 {len(subtitle)} 字符"
+                self._reply(200, {"code": 0, "msg": "", "data": json.dumps({"summary": summary})})
+
+            def _reply(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/workflow/run"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+class ServerUnderTest:
+    """
+    在临时目录中以子进程启动 Web 服务，PATH 中的 yt-dlp 和 Coze 地址都指向替身
+    """
+
+    def __init__(self, work_dir, coze_url, scenario, server="flask", extra_env=None):
+        self.work_dir = work_dir
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        bin_dir = os.path.join(work_dir, "bin")
+        os.makedirs(bin_dir, exist_ok=True)
+        write_stub_ytdlp(bin_dir)
+
+        self.env = dict(os.environ)
+        self.env.update({
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "HOST": "127.0.0.1",
+            "PORT": str(self.port),
+            "COZE_API_BASE_URL": coze_url,
+            "COZE_WORKFLOW_ID": "1",
+            "COZE_TOKEN": "loadtest-token",
+            "LOG_LEVEL": "WARNING",
+            "FAKE_YTDLP_DELAY": str(scenario["ytdlp_delay"]),
+            "FAKE_YTDLP_CUES": str(scenario["cues"]),
+            "FAKE_YTDLP_ERROR_RATE": str(scenario["ytdlp_error_rate"]),
+        })
+        self.env.update(extra_env or {})
+        self.cmd = [
+            part.format(python=sys.executable, project=PROJECT_DIR)
+            for part in SERVER_COMMANDS[server]
+        ]
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.cmd, cwd=self.work_dir, env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise Exception(f"被测服务启动失败，退出码 {self.process.returncode}")
+            try:
+                requests.get(f"{self.base_url}/health", timeout=1)
+                return self
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        self.process.kill()
+        raise Exception("等待被测服务启动超时")
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位数，输入需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def is_successful_response(response):
+    """
+    判断 /download-subtitle 是否真正处理成功
+
+    Coze 调用失败时服务仍可能返回 200 JSON（没有 data 字段就不会生成 Markdown），
+    因此只有收到 Markdown 附件，或 JSON 中 coze_response.code 为 0 时才算成功。
+    """
+    if response.status_code != 200:
+        return False
+    if response.headers.get("Content-Type", "").startswith("text/markdown"):
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    coze_response = body.get("coze_response") if isinstance(body, dict) else None
+    return isinstance(coze_response, dict) and coze_response.get("code") == 0
+
+def drive(base_url, concurrency, total_requests, timeout=300):
+    """
+    并发发送 /download-subtitle 请求
+
+    Returns:
+        dict: 吞吐量、延迟百分位（毫秒）和错误率
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def one(index):
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                f"{base_url}/download-subtitle",
+                json={"url": f"https://www.youtube.com/watch?v=load{index}"},
+                timeout=timeout,
+            )
+            ok = is_successful_response(response)
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total_requests)))
+    elapsed = time.perf_counter() - started
+    session.close()
+
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    errors = sum(1 for _, ok in outcomes if not ok)
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "error_rate": round(errors / total_requests, 4) if total_requests else 0.0,
+    }
+
+def run_scenario(name, scenario, server="flask"):
+    """
+    启动替身和被测服务，运行一个场景
+
+    Returns:
+        dict: 场景名称、参数和 drive() 的统计结果
+    """
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as work_dir:
+        with CozeStubServer(scenario["coze_latency"], scenario["coze_error_rate"]) as coze:
+            with ServerUnderTest(work_dir, coze.url, scenario, server=server) as target:
+                stats = drive(target.base_url, scenario["concurrency"], scenario["requests"])
+    result = {"scenario": name, "server": server}
+    result.update(scenario)
+    result.update(stats)
+    return result
+
+def format_report(results):
+    """把多个场景的结果格式化为表格"""
+    header = f"{'场景':<18}{'服务':<8}{'并发':>6}{'请求':>7}{'吞吐(rps)':>11}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'错误率':>9}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r['scenario']:<18}{r['server']:<8}{r['concurrency']:>6}{r['requests']:>7}"
+            f"{r['throughput_rps']:>11}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+            f"{r['error_rate']:>9.2%}"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="离线压测 /download-subtitle")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="要运行的场景，可重复指定，默认运行全部")
+    parser.add_argument("--server", default="flask", choices=sorted(SERVER_COMMANDS),
+                        help="被测服务模式")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    for key in ("concurrency", "requests", "cues"):
+        parser.add_argument(f"--{key}", type=int, help=f"覆盖场景中的 {key}")
+    for key in ("ytdlp_delay", "ytdlp_error_rate", "coze_latency", "coze_error_rate"):
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=float,
+                            help=f"覆盖场景中的 {key}")
+    args = parser.parse_args()
+
+    overrides = {
+        key: value for key, value in vars(args).items()
+        if key in SCENARIOS["baseline"] and value is not None
+    }
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        scenario = dict(SCENARIOS[name], **overrides)
+        if not args.json:
+            print(f"运行场景 {name}: {scenario}", file=sys.stderr)
+        results.append(run_scenario(name, scenario, server=args.server))
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print(format_report(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+日志工具：分级日志配置、结构化（JSON）输出、延迟格式化、载荷摘要与敏感信息脱敏
+"""
+
+import hashlib
+import json
+import logging
+import sys
+
+LOGGER_NAME = "extract_subtitles"
+
+# 需要脱敏的字段名（不区分大小写）
+SECRET_KEYS = {"authorization", "token", "cookie", "set-cookie", "x-api-key"}
+REDACTED = "***"
+
+# LogRecord 的内置属性，结构化输出时只额外输出 extra 传入的字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def get_logger(name=None):
+    """获取项目日志记录器（或其子记录器）"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+class lazy:
+    """
+    延迟求值包装：只有在日志真正输出时才调用 func 生成字符串
+
+    用法: logger.debug("payload: %s", lazy(json.dumps, payload))
+    """
+
+    __slots__ = ("func", "args", "kwargs")
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.func(*self.args, **self.kwargs))
+
+def summarize_text(text):
+    """
+    用长度和哈希概括一段文本，代替在日志中输出全文
+
+    Args:
+        text (str | bytes): 文本内容
+
+    Returns:
+        str: 形如 "chars=1234 sha256=0123456789ab" 的摘要
+    """
+    if text is None:
+        return "None"
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    unit = "chars" if isinstance(text, str) else "bytes"
+    return f"{unit}={len(text)} sha256={hashlib.sha256(data).hexdigest()[:12]}"
+
+def redact(mapping):
+    """
+    返回脱敏后的字典副本，SECRET_KEYS 中的字段值被替换为 ***
+
+    Args:
+        mapping (dict): 请求头、请求体等
+
+    Returns:
+        dict: 脱敏后的副本
+    """
+    if not isinstance(mapping, dict):
+        return mapping
+    return {
+        k: (REDACTED if str(k).lower() in SECRET_KEYS else v)
+        for k, v in mapping.items()
+    }
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra 传入的字段作为顶层键"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(level="INFO", fmt="text"):
+    """
+    配置项目日志输出到 stderr，重复调用只会替换已有的处理器
+
+    Args:
+        level (str): 日志级别，如 'DEBUG'、'INFO'、'WARNING'
+        fmt (str): 'text' 为普通文本，'json' 为每行一条 JSON
+    """
+    logger = get_logger()
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    return logger
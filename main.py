@@ -13,12 +13,26 @@ import subprocess
 import sys
 import json
 import re
+import hashlib
+import socket
+import threading
+import time
+import uuid
+import functools
+import itertools
+import tempfile
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote
 import requests
-import traceback
 
 try:
     from flask import Flask, request, jsonify, send_file, Response
     from flask_cors import CORS
+    from werkzeug.exceptions import HTTPException
+    from werkzeug.http import is_resource_modified
+    from werkzeug.utils import safe_join
 except ImportError:
     print("错误: 找不到 Flask 模块。请确保已安装依赖:")
     print("1. 运行 ./install.sh 脚本，或")
@@ -27,10 +41,19 @@ except ImportError:
 
 # 导入配置
 from config import Config
+from logging_utils import get_logger, configure_logging, lazy, summarize_text, redact
+from backend import get_backend, submit_job, update_job, get_job, JOB_QUEUE
+from profiling import init_profiling, span, trace_context
+
+logger = get_logger()
 
 app = Flask(__name__)
 # 启用 CORS 支持，允许所有来源
 CORS(app, resources={r"/*": {"origins": "*"}})
+# 由前端服务器（Apache / lighttpd）通过 X-Sendfile 发送文件
+app.config['USE_X_SENDFILE'] = Config.USE_X_SENDFILE
+# 请求 ID、分阶段耗时（Server-Timing）和按需采样分析
+init_profiling(app)
 
 # 创建存储字幕的目录
 SUBTITLES_DIR = Config.SUBTITLES_DIR
@@ -40,75 +63,317 @@ os.makedirs(SUBTITLES_DIR, exist_ok=True)
 COOKIES_DIR = Config.COOKIES_DIR
 os.makedirs(COOKIES_DIR, exist_ok=True)
 
-def clean_subtitle_content(content):
+# 共享后端（字幕缓存、Coze 结果缓存、单飞锁、任务队列），未配置时为 None
+BACKEND = get_backend(Config.BACKEND_URL)
+
+# 字幕清洗用到的正则，预编译避免每行重复查找缓存
+TIMESTAMP_PATTERN = re.compile(r'^\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}')
+META_PATTERN = re.compile(r'^(Kind|Language):', re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def _is_subtitle_text_line(stripped):
+    """判断去除首尾空白后的行是否为字幕正文（非空、非头部、非时间戳）"""
+    return bool(stripped) and not (
+        stripped.upper() == "WEBVTT" or
+        META_PATTERN.match(stripped) or
+        TIMESTAMP_PATTERN.match(stripped)
+    )
+
+def clean_subtitle_lines(lines):
     """
-    清洗字幕内容，按要求处理文本
+    逐行清洗字幕，每遇到一段连续的字幕文本行产出一个合并后的片段
+    
+    只保留当前字幕块的几行，可以直接传入打开的文件对象，内存占用与文件大小无关。
     
     Args:
-        content (str): 原始字幕内容
+        lines (iterable): 字幕行（可带换行符）
     
-    Returns:
-        str: 清洗后的文本
+    Yields:
+        str: 合并并处理多余空格后的字幕文本
     """
-    lines = content.split('\n')
-    cleaned_lines = []
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # 跳过空行
-        if not line:
-            i += 1
-            continue
-            
-        # 跳过 WEBVTT 行
-        if line.upper() == "WEBVTT":
-            i += 1
+    subtitle_text_lines = []
+    # 末尾追加一个空行，保证最后一段字幕文本也会被输出
+    for line in itertools.chain(lines, ['']):
+        # 跳过空行、WEBVTT 行、Kind/Language 等元信息行以及时间戳行
+        if _is_subtitle_text_line(line.strip()):
+            # 收集连续的字幕文本行，并处理当前行的HTML实体
+            subtitle_text_lines.append(line.replace('&nbsp;', ' ').strip())
             continue
-            
-        # 跳过 Kind, Language 等元信息行
-        if re.match(r'^(Kind|Language):', line, re.IGNORECASE):
-            i += 1
-            continue
-            
-        # 跳过时间戳行
-        if re.match(r'^\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}', line):
-            i += 1
-            continue
-            
-        # 处理字幕文本行
-        # 收集连续的字幕文本行
-        subtitle_text_lines = []
-        while i < len(lines) and lines[i].strip() and not (
-            lines[i].strip().upper() == "WEBVTT" or
-            re.match(r'^(Kind|Language):', lines[i].strip(), re.IGNORECASE) or
-            re.match(r'^\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}', lines[i].strip())
-        ):
-            # 处理当前行的HTML实体
-            cleaned_line = lines[i].replace('&nbsp;', ' ')
-            # 可以在这里添加更多HTML实体的处理
-            subtitle_text_lines.append(cleaned_line.strip())
-            i += 1
         
         # 合并收集到的字幕行
         if subtitle_text_lines:
             # 合并行并处理多余的空格
-            merged_line = ' '.join(subtitle_text_lines)
-            merged_line = re.sub(r'\s+', ' ', merged_line).strip()
+            merged_line = WHITESPACE_PATTERN.sub(' ', ' '.join(subtitle_text_lines)).strip()
+            subtitle_text_lines = []
             if merged_line:
-                cleaned_lines.append(merged_line)
-        
-        # 不增加 i，因为内部循环已经处理过了
+                yield merged_line
+
+def clean_subtitle_content(content):
+    """
+    清洗字幕内容，按要求处理文本
+    
+    Args:
+        content (str): 原始字幕内容
     
+    Returns:
+        str: 清洗后的文本
+    """
     # 用空格连接所有清洗后的行，形成最终的连续文本
-    cleaned_text = ' '.join(cleaned_lines)
+    cleaned_text = ' '.join(clean_subtitle_lines(content.split('\n')))
     
     # 最终清理多余的空格
-    cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
+    cleaned_text = WHITESPACE_PATTERN.sub(' ', cleaned_text).strip()
     
     return cleaned_text
 
+# 流式处理时每次从文件或缓冲区读取的大小
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class SpooledJsonText:
+    """
+    流式处理时保存清洗后文本的缓冲区
+    
+    文本以 JSON 字符串转义后的 UTF-8 形式写入 SpooledTemporaryFile，超过 SPOOL_MAX_SIZE 后转存到临时文件，
+    之后可以通过 SpooledJsonDocument 直接嵌入 Coze 请求体和 JSON 响应，不需要在内存中还原全文。
+    同时累计原文的字符数和 sha256，用于日志摘要和 Coze 结果缓存的键。
+    """
+    
+    def __init__(self, max_size=None):
+        """
+        Args:
+            max_size (int): 内存中最多缓冲的字节数，默认为 Config.SPOOL_MAX_SIZE
+        """
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_size or Config.SPOOL_MAX_SIZE)
+        self._digest = hashlib.sha256()
+        self.chars = 0
+        self.size = 0
+    
+    def write(self, text):
+        """追加一段文本"""
+        self._digest.update(text.encode('utf-8'))
+        self.chars += len(text)
+        escaped = json.dumps(text, ensure_ascii=False)[1:-1].encode('utf-8')
+        self._file.write(escaped)
+        self.size += len(escaped)
+    
+    def hexdigest(self):
+        """
+        Returns:
+            str: 原文（UTF-8）的 sha256，与对完整字符串计算的结果相同
+        """
+        return self._digest.hexdigest()
+    
+    def iter_chunks(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Yields:
+            bytes: 转义后的文本片段
+        """
+        self._file.seek(0)
+        for chunk in iter(lambda: self._file.read(chunk_size), b''):
+            yield chunk
+    
+    def text(self):
+        """还原全文（会把全文读入内存，只用于小文本和测试）"""
+        self._file.seek(0)
+        return json.loads(b'"' + self._file.read() + b'"')
+    
+    def close(self):
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+    
+    def __str__(self):
+        # 与 summarize_text 的格式相同，供日志使用
+        return f"chars={self.chars} sha256={self.hexdigest()[:12]}"
+
+class SpooledJsonDocument:
+    """
+    含有 SpooledJsonText 的 JSON 文档：其余字段正常序列化，缓冲区中的文本按块输出
+    
+    提供 __len__，作为 requests 的请求体时会设置 Content-Length 而不是使用分块传输编码。
+    """
+    
+    _PLACEHOLDER = '\x00spooled-text\x00'
+    
+    def __init__(self, document, spool):
+        """
+        Args:
+            document: 可 JSON 序列化的对象，其中某个值为 spool
+            spool (SpooledJsonText): 文本缓冲区
+        """
+        def default(value):
+            if value is spool:
+                return self._PLACEHOLDER
+            raise TypeError(f"无法序列化 {type(value).__name__}")
+        
+        encoded = json.dumps(document, ensure_ascii=False, default=default)
+        head, tail = encoded.split(json.dumps(self._PLACEHOLDER), 1)
+        self.head = (head + '"').encode('utf-8')
+        self.tail = ('"' + tail).encode('utf-8')
+        self.spool = spool
+    
+    def __len__(self):
+        return len(self.head) + self.spool.size + len(self.tail)
+    
+    def __iter__(self):
+        yield self.head
+        yield from self.spool.iter_chunks()
+        yield self.tail
+
+def clean_subtitle_file(path, clean_text=True, max_size=None):
+    """
+    逐行读取字幕文件并清洗到 SpooledJsonText，结果与对文件全文调用 clean_subtitle_content 相同
+    
+    Args:
+        path (str): 字幕文件路径
+        clean_text (bool): 为 False 时原样保存文件内容
+        max_size (int): 内存中最多缓冲的字节数，默认为 Config.SPOOL_MAX_SIZE
+    
+    Returns:
+        SpooledJsonText: 文本缓冲区，调用方负责关闭
+    """
+    spool = SpooledJsonText(max_size)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if clean_text:
+                for index, merged_line in enumerate(clean_subtitle_lines(f)):
+                    spool.write(merged_line if index == 0 else ' ' + merged_line)
+            else:
+                for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), ''):
+                    spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+def build_ytdlp_command(url, lang='en', browser=None, cookies_file=None, output_dir=None):
+    """
+    构建下载字幕的 yt-dlp 命令（同步和异步服务共用）
+    
+    Args:
+        url (str): YouTube 视频链接
+        lang (str): 字幕语言，默认为 'en'
+        browser (str): 浏览器名称，用于获取 cookies (如 'chrome', 'firefox', 'safari')
+        cookies_file (str): cookies 文件路径
+        output_dir (str): 字幕保存目录，默认为 SUBTITLES_DIR
+    
+    Returns:
+        list: 命令参数列表
+    """
+    # 构建 yt-dlp 命令基础部分
+    cmd = [
+        "yt-dlp",
+        "--write-auto-sub",      # 写入自动翻译的字幕
+        "--write-sub",           # 写入手动添加的字幕
+        f"--sub-lang={lang}",    # 指定语言
+        "--skip-download",       # 跳过视频下载
+        "--sub-format=vtt",      # 指定字幕格式
+        "-o", f"{output_dir or SUBTITLES_DIR}/%(title)s [%(id)s].%(ext)s",  # 输出路径（包含视频 ID，便于导出）
+    ]
+    
+    # 添加浏览器 cookies 参数
+    if browser:
+        cmd.extend(["--cookies-from-browser", browser])
+    elif cookies_file and os.path.exists(cookies_file):
+        cmd.extend(["--cookies", cookies_file])
+    else:
+        # 如果没有指定浏览器或 cookies 文件，则尝试默认浏览器
+        # 注意：这可能会导致某些视频无法访问
+        pass
+        
+    # 添加 URL
+    cmd.append(url)
+    return cmd
+
+def ytdlp_error(error_msg, browser=None):
+    """
+    把 yt-dlp 的错误输出转换为带解决建议的异常
+    
+    Args:
+        error_msg (str): yt-dlp 的 stderr 输出
+        browser (str): 请求中使用的浏览器名称
+    
+    Returns:
+        Exception: 待抛出的异常
+    """
+    # 检查是否是身份验证错误
+    if "Sign in to confirm you're not a bot" in error_msg:
+        return Exception(
+            "需要身份验证才能访问此视频。\n"
+            "请提供浏览器信息或 cookies 文件。\n"
+            "支持的浏览器: chrome, firefox, safari, edge\n"
+            "或者导出 cookies 文件并提供路径。"
+        )
+    # 检查是否是浏览器 cookies 数据库未找到的错误
+    if "could not find" in error_msg.lower() and "cookies database" in error_msg.lower():
+        if browser:
+            return Exception(
+                f"无法从浏览器 '{browser}' 获取 cookies。\n"
+                "浏览器 cookies 数据库未找到或无法访问。\n"
+                "建议解决方案：\n"
+                "1. 使用浏览器扩展（如 'Get cookies.txt'）导出 YouTube 的 cookies\n"
+                "2. 将 cookies 文件保存到项目的 cookies/ 目录\n"
+                "3. 在请求中使用 'cookies_file' 参数而不是 'browser' 参数\n"
+                f"原始错误: {error_msg}"
+            )
+    return Exception(f"下载失败: {error_msg}")
+
+def find_latest_subtitle(directory=None):
+    """
+    Args:
+        directory (str): 查找的目录，默认为 SUBTITLES_DIR
+    
+    Returns:
+        str: 目录中最新下载的字幕文件路径
+    """
+    directory = directory or SUBTITLES_DIR
+    # 查找下载的文件
+    downloaded_files = []
+    for file in os.listdir(directory):
+        if file.endswith(".vtt"):
+            downloaded_files.append(os.path.join(directory, file))
+    
+    if not downloaded_files:
+        raise Exception("未找到下载的字幕文件")
+    
+    # 返回最新下载的文件
+    return max(downloaded_files, key=os.path.getctime)
+
+@contextmanager
+def private_download_dir():
+    """
+    在字幕目录下创建本次下载专用的临时目录，退出时删除（同步和异步服务共用）
+    
+    并发下载（多个工作线程、异步请求）各自写入自己的目录，不会误取其他请求刚下载的文件。
+    
+    Yields:
+        str: 临时目录路径
+    """
+    download_dir = tempfile.mkdtemp(prefix='.download-', dir=SUBTITLES_DIR)
+    try:
+        yield download_dir
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+def move_downloaded_subtitle(download_dir):
+    """
+    把临时目录中下载的字幕文件移入字幕目录
+    
+    Args:
+        download_dir (str): private_download_dir 创建的临时目录
+    
+    Returns:
+        str: 移入字幕目录后的文件路径
+    """
+    downloaded = find_latest_subtitle(download_dir)
+    subtitle_file = os.path.join(SUBTITLES_DIR, os.path.basename(downloaded))
+    os.replace(downloaded, subtitle_file)
+    return subtitle_file
+
 def download_subtitle(url, lang='en', browser=None, cookies_file=None):
     """
     使用 yt-dlp 下载指定语言的字幕
@@ -123,135 +388,115 @@ def download_subtitle(url, lang='en', browser=None, cookies_file=None):
         str: 下载的字幕文件路径
     """
     try:
-        # 构建 yt-dlp 命令基础部分
-        cmd = [
-            "yt-dlp",
-            "--write-auto-sub",      # 写入自动翻译的字幕
-            "--write-sub",           # 写入手动添加的字幕
-            f"--sub-lang={lang}",    # 指定语言
-            "--skip-download",       # 跳过视频下载
-            "--sub-format=vtt",      # 指定字幕格式
-            "-o", f"{SUBTITLES_DIR}/%(title)s.%(ext)s",  # 输出路径
-        ]
-        
-        # 添加浏览器 cookies 参数
-        if browser:
-            cmd.extend(["--cookies-from-browser", browser])
-        elif cookies_file and os.path.exists(cookies_file):
-            cmd.extend(["--cookies", cookies_file])
-        else:
-            # 如果没有指定浏览器或 cookies 文件，则尝试默认浏览器
-            # 注意：这可能会导致某些视频无法访问
-            pass
+        with private_download_dir() as download_dir:
+            cmd = build_ytdlp_command(url, lang, browser, cookies_file, output_dir=download_dir)
+            logger.debug("执行命令: %s", lazy(' '.join, cmd))
+            
+            # 执行命令
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            
+            if result.returncode != 0:
+                raise ytdlp_error(result.stderr.strip(), browser)
             
-        # 添加 URL
-        cmd.append(url)
-        
-        print(f"执行命令: {' '.join(cmd)}")
-        
-        # 执行命令
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            error_msg = result.stderr.strip()
-            # 检查是否是身份验证错误
-            if "Sign in to confirm you're not a bot" in error_msg:
-                raise Exception(
-                    "需要身份验证才能访问此视频。\n"
-                    "请提供浏览器信息或 cookies 文件。\n"
-                    "支持的浏览器: chrome, firefox, safari, edge\n"
-                    "或者导出 cookies 文件并提供路径。"
-                )
-            # 检查是否是浏览器 cookies 数据库未找到的错误
-            if "could not find" in error_msg.lower() and "cookies database" in error_msg.lower():
-                if browser:
-                    raise Exception(
-                        f"无法从浏览器 '{browser}' 获取 cookies。\n"
-                        "浏览器 cookies 数据库未找到或无法访问。\n"
-                        "建议解决方案：\n"
-                        "1. 使用浏览器扩展（如 'Get cookies.txt'）导出 YouTube 的 cookies\n"
-                        "2. 将 cookies 文件保存到项目的 cookies/ 目录\n"
-                        "3. 在请求中使用 'cookies_file' 参数而不是 'browser' 参数\n"
-                        f"原始错误: {error_msg}"
-                    )
-            raise Exception(f"下载失败: {error_msg}")
-        
-        # 查找下载的文件
-        downloaded_files = []
-        for file in os.listdir(SUBTITLES_DIR):
-            if file.endswith(".vtt"):
-                downloaded_files.append(os.path.join(SUBTITLES_DIR, file))
-        
-        if not downloaded_files:
-            raise Exception("未找到下载的字幕文件")
-        
-        # 返回最新下载的文件
-        latest_file = max(downloaded_files, key=os.path.getctime)
-        return latest_file
+            return move_downloaded_subtitle(download_dir)
         
     except Exception as e:
         raise Exception(f"下载字幕时出错: {str(e)}")
 
-def send_to_coze_workflow(workflow_id, token, cleaned_text, file_name):
+def build_coze_request(workflow_id, token, cleaned_text):
+    """
+    构建 Coze 工作流请求（同步和异步服务共用）
+    
+    Args:
+        workflow_id (str): Coze 工作流 ID
+        token (str): Coze API Token
+        cleaned_text (str | SpooledJsonText): 清洗后的文本内容
+    
+    Returns:
+        tuple: (请求地址, 请求头, 请求数据)
+    """
+    # Coze API URL
+    api_url = f"{Config.COZE_API_BASE_URL}"
+    
+    # 请求头
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    
+    # 请求数据 - 根据您提供的格式调整
+    payload = {
+        "workflow_id": int(workflow_id),  # 确保是整数类型
+        "parameters": {
+            "subtitle": cleaned_text
+        }
+    }
+    return api_url, headers, payload
+
+def parse_coze_response(status_code, headers, content):
+    """
+    解析 Coze API 响应
+    
+    Args:
+        status_code (int): HTTP 状态码
+        headers: 响应头
+        content (bytes): 响应体
+    
+    Returns:
+        dict: 工作流响应
+    """
+    logger.debug("Coze API 响应头: %s", lazy(redact, dict(headers)))
+    
+    # 检查响应内容是否为空
+    if not content:
+        raise Exception("Coze API 返回空响应")
+    
+    text = content.decode('utf-8', errors='replace')
+    # 检查响应是否为 JSON 格式
+    if not headers.get('Content-Type', '').startswith('application/json'):
+        raise Exception(f"Coze API 返回非 JSON 响应: {text[:200]}")
+    try:
+        result = json.loads(content)
+    except json.JSONDecodeError as je:
+        raise Exception(f"Coze API 返回无效 JSON: {je}. 原始响应: {text[:200]}")
+    logger.info("Coze API 响应: status=%s code=%s body=%s",
+                status_code, result.get('code', 'N/A'),
+                lazy(summarize_text, content))
+    return result
+
+def send_to_coze_workflow(workflow_id, token, cleaned_text, file_name, session=None):
     """
     发送清洗后的文本到 Coze 工作流
     
     Args:
         workflow_id (str): Coze 工作流 ID
         token (str): Coze API Token
-        cleaned_text (str): 清洗后的文本内容
+        cleaned_text (str | SpooledJsonText): 清洗后的文本内容，为缓冲区时请求体按块流式发送
         file_name (str): 字幕文件名
+        session (requests.Session): 可选的复用会话，批量调用时保持连接池
     
     Returns:
         dict: 工作流响应
     """
     try:
-        # Coze API URL
-        api_url = f"{Config.COZE_API_BASE_URL}"
-        
-        # 请求头
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        api_url, headers, payload = build_coze_request(workflow_id, token, cleaned_text)
+        streamed = isinstance(cleaned_text, SpooledJsonText)
         
-        # 请求数据 - 根据您提供的格式调整
-        payload = {
-            "workflow_id": int(workflow_id),  # 确保是整数类型
-            "parameters": {
-                "subtitle": cleaned_text
-            }
-        }
-        
-        print(f"正在发送请求到 Coze API: {api_url}")
-        print(f"请求头: {headers}")
-        # 打印完整请求数据
-        print(f"请求数据: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+        # 默认只记录载荷的大小和哈希，DEBUG 级别才输出完整请求数据
+        logger.info("发送请求到 Coze API: url=%s file=%s subtitle=%s",
+                    api_url, file_name, cleaned_text if streamed else lazy(summarize_text, cleaned_text))
+        logger.debug("Coze 请求头: %s", lazy(redact, headers))
+        logger.debug("Coze 请求数据: %s", lazy(json.dumps, payload, ensure_ascii=False, default=str))
         
         # 发送 POST 请求到 Coze API
-        response = requests.post(api_url, headers=headers, json=payload, timeout=200)
-        
-        print(f"Coze API 响应状态码: {response.status_code}")
-        print(f"Coze API 响应头: {dict(response.headers)}")
-        
-        # 检查响应内容是否为空
-        if not response.content:
-            raise Exception("Coze API 返回空响应")
-        
-        # 尝试解析 JSON
-        try:
-            response_text = response.text
-            print(f"Coze API 响应内容长度: {len(response_text)} 字符")
-            
-            # 检查响应是否为 JSON 格式
-            if response.headers.get('Content-Type', '').startswith('application/json'):
-                result = response.json()
-                print(f"成功解析 JSON 响应，响应码: {result.get('code', 'N/A')}")
-                return result
-            else:
-                raise Exception(f"Coze API 返回非 JSON 响应: {response_text[:200]}")
-        except json.JSONDecodeError as je:
-            raise Exception(f"Coze API 返回无效 JSON: {je}. 原始响应: {response.text[:200]}")
+        http = session if session is not None else requests
+        if streamed:
+            # 请求体从缓冲区按块发送，不在内存中拼出完整的 JSON
+            response = http.post(api_url, headers=headers,
+                                 data=SpooledJsonDocument(payload, cleaned_text), timeout=200)
+        else:
+            response = http.post(api_url, headers=headers, json=payload, timeout=200)
+        return parse_coze_response(response.status_code, response.headers, response.content)
             
     except requests.exceptions.Timeout:
         raise Exception("Coze API 请求超时")
@@ -262,147 +507,521 @@ def send_to_coze_workflow(workflow_id, token, cleaned_text, file_name):
     except Exception as e:
         raise Exception(f"发送到 Coze 工作流出错: {str(e)}")
 
-@app.route('/download-subtitle', methods=['POST'])
-def handle_download_request():
+def extract_coze_summary(coze_data):
     """
-    处理下载字幕的请求
+    从 Coze 工作流返回的 data 字段中提取 summary 内容
+    
+    Args:
+        coze_data: Coze 响应中的 data 字段（dict 或 JSON 字符串）
+    
+    Returns:
+        str: summary 内容，无法提取时返回 None
     """
-    try:
-        # 打印请求信息以便调试
-        print(f"\n收到 /download-subtitle 请求")
-        print(f"请求方法: {request.method}")
-        print(f"Content-Type: {request.content_type}")
-        
-        data = request.json
-        if data is None:
-            print("警告: request.json 为 None，尝试解析原始数据")
-            if request.data:
-                try:
-                    data = json.loads(request.data)
-                except json.JSONDecodeError as e:
-                    print(f"无法解析 JSON 数据: {e}")
-                    return jsonify({"error": f"无效的 JSON 数据: {str(e)}"}), 400
-            else:
-                return jsonify({"error": "请求体为空"}), 400
+    summary_content = None
+    if isinstance(coze_data, dict) and 'summary' in coze_data:
+        summary_content = coze_data['summary']
+    elif isinstance(coze_data, str):
+        try:
+            coze_data_dict = json.loads(coze_data)
+            if isinstance(coze_data_dict, dict) and 'summary' in coze_data_dict:
+                summary_content = coze_data_dict['summary']
+        except json.JSONDecodeError:
+            # 如果不是JSON格式，保持原样
+            summary_content = coze_data
+    else:
+        summary_content = str(coze_data)
+    return summary_content
+
+def save_coze_markdown(coze_response, subtitle_file):
+    """
+    将 Coze 工作流结果保存为与字幕文件同名的 Markdown 文件
+    
+    Args:
+        coze_response (dict): Coze 工作流响应
+        subtitle_file (str): 字幕文件路径
+    
+    Returns:
+        str: 生成的 Markdown 文件路径，响应中没有 data 字段时返回 None
+    """
+    if not coze_response or 'data' not in coze_response:
+        return None
+    
+    coze_data = coze_response['data']
+    summary_content = extract_coze_summary(coze_data)
+    
+    # 创建 Markdown 文件
+    md_filename = os.path.splitext(subtitle_file)[0] + '_coze_result.md'
+    with open(md_filename, 'w', encoding='utf-8') as f:
+        # 写入 summary 内容到 Markdown 文件
+        if summary_content:
+            f.write(summary_content)
+        else:
+            f.write(str(coze_data))
+    return md_filename
+
+class SubtitlePipeline:
+    """
+    可复用的字幕处理流水线：下载 -> 清洗 -> 发送到 Coze -> 生成 Markdown
+    
+    配置在构造时确定一次，之后可多次调用 process / process_many，
+    不会重新读取配置文件，也不会向控制台输出内容（运行信息只写入 extract_subtitles 日志记录器）。
+    """
+    
+    def __init__(self, lang='en', browser=None, cookies_file=None,
+                 workflow_id=None, token=None, clean_text=True,
+                 send_to_coze=None, include_original=False, backend=None):
+        """
+        Args:
+            lang (str): 字幕语言，默认为 'en'
+            browser (str): 浏览器名称，用于获取 cookies
+            cookies_file (str): cookies 文件路径
+            workflow_id (str): Coze 工作流 ID，默认使用 Config 中的值
+            token (str): Coze API Token，默认使用 Config 中的值
+            clean_text (bool): 是否清洗文本，默认为 True
+            send_to_coze (bool): 是否发送到 Coze，默认在 Coze 已配置时发送
+            include_original (bool): 结果中是否包含原始字幕内容
+            backend: 共享后端（见 backend.py），设置后字幕和 Coze 结果会在节点间缓存，
+                同一视频同一时间只有一个节点在下载
+        """
+        self.lang = lang
+        self.browser = browser
+        self.cookies_file = cookies_file
+        self.workflow_id = workflow_id if workflow_id is not None else Config.COZE_WORKFLOW_ID
+        self.token = token if token is not None else Config.COZE_TOKEN
+        self.clean_text = clean_text
+        if send_to_coze is None:
+            send_to_coze = bool(self.workflow_id and self.token)
+        self.send_to_coze = send_to_coze
+        self.include_original = include_original
+        self.backend = backend
+        self._session = None
+    
+    @property
+    def session(self):
+        """复用的 HTTP 会话，首次使用时创建"""
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+    
+    def close(self):
+        """关闭复用的 HTTP 会话"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+    
+    def process(self, url):
+        """
+        处理单个视频
         
-        print(f"请求数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
+        Args:
+            url (str): YouTube 视频链接
         
-        url = data.get('url')
-        lang = data.get('lang', 'en')
-        browser = data.get('browser')  # 浏览器名称，如 'chrome', 'firefox'
-        cookies_file = data.get('cookies_file')  # cookies 文件路径
-        clean_text = data.get('clean_text', True)  # 是否清洗文本
-        # Coze 配置（如果未在配置文件中设置）
-        workflow_id = data.get('workflow_id', Config.COZE_WORKFLOW_ID)
-        token = data.get('token', Config.COZE_TOKEN)
-        send_to_coze = data.get('send_to_coze', True)  # 是否发送到 Coze
+        Returns:
+            dict: 包含 status、subtitle_file、cleaned_text、coze_response、markdown_file 等字段
         
-        if not url:
-            return jsonify({"error": "缺少视频 URL"}), 400
+        Raises:
+            Exception: 下载或发送到 Coze 失败时抛出
+        """
+        if self.send_to_coze and not (self.workflow_id and self.token):
+            raise Exception("未配置 Coze 工作流信息")
         
-        # 检查是否需要发送到 Coze 但没有配置信息
-        if send_to_coze and not (workflow_id and token):
-            return jsonify({
-                "error": "未配置 Coze 工作流信息",
-                "message": "请在配置文件中设置 Coze 工作流 ID 和 Token，或在请求中提供"
-            }), 400
+        subtitle_file, subtitle_content = self._fetch_subtitle(url)
         
-        # 下载字幕
-        subtitle_file = download_subtitle(url, lang, browser, cookies_file)
+        result = {
+            "status": "success",
+            "url": url,
+            "subtitle_file": subtitle_file
+        }
+        if self.include_original:
+            result["original_content"] = subtitle_content
         
-        # 读取原始字幕内容
-        with open(subtitle_file, 'r', encoding='utf-8') as f:
-            subtitle_content = f.read()
+        text = subtitle_content
+        if self.clean_text:
+            with span('clean'):
+                text = clean_subtitle_content(subtitle_content)
+            result["cleaned_text"] = text
+        
+        if self.send_to_coze:
+            with span('coze'):
+                coze_response = self._run_coze(text, os.path.basename(subtitle_file))
+            result["coze_response"] = coze_response
+            with span('markdown'):
+                markdown_file = save_coze_markdown(coze_response, subtitle_file)
+            if markdown_file:
+                result["markdown_file"] = markdown_file
+        
+        return result
+    
+    def process_stream(self, url):
+        """
+        流式处理单个视频，每个请求的峰值内存不随字幕文件大小增长
         
-        # 默认进行文本清洗
-        cleaned_text = None
-        if clean_text:
-            cleaned_text = clean_subtitle_content(subtitle_content)
+        逐行读取字幕文件并清洗到 SpooledJsonText，Coze 请求体和 JSON 响应都从缓冲区按块读取。
+        不使用共享后端的字幕缓存（缓存需要完整内容），Coze 结果缓存仍然生效。
+        
+        Args:
+            url (str): YouTube 视频链接
+        
+        Returns:
+            dict: 与 process 相同，但不包含 original_content，cleaned_text 为 SpooledJsonText（调用方负责关闭）
+        
+        Raises:
+            Exception: 下载或发送到 Coze 失败时抛出
+        """
+        if self.send_to_coze and not (self.workflow_id and self.token):
+            raise Exception("未配置 Coze 工作流信息")
+        
+        with span('download'):
+            subtitle_file = download_subtitle(url, self.lang, self.browser, self.cookies_file)
         
         result = {
             "status": "success",
-            "subtitle_file": subtitle_file,
-            "original_content": subtitle_content
+            "url": url,
+            "subtitle_file": subtitle_file
         }
+        if not (self.clean_text or self.send_to_coze):
+            return result
         
-        if clean_text:
-            result["cleaned_text"] = cleaned_text
-        
-        # 发送到 Coze 工作流
-        coze_result = None
-        markdown_file = None
-        if send_to_coze:
-            coze_response = send_to_coze_workflow(
-                workflow_id, 
-                token, 
-                cleaned_text if clean_text else subtitle_content, 
-                os.path.basename(subtitle_file)
+        with span('clean'):
+            text = clean_subtitle_file(subtitle_file, self.clean_text)
+        try:
+            if self.send_to_coze:
+                with span('coze'):
+                    coze_response = self._run_coze(text, os.path.basename(subtitle_file))
+                result["coze_response"] = coze_response
+                with span('markdown'):
+                    markdown_file = save_coze_markdown(coze_response, subtitle_file)
+                if markdown_file:
+                    result["markdown_file"] = markdown_file
+        except BaseException:
+            text.close()
+            raise
+        
+        if self.clean_text:
+            result["cleaned_text"] = text
+        else:
+            text.close()
+        return result
+    
+    def _download(self, url):
+        with span('download'):
+            subtitle_file = download_subtitle(
+                url, self.lang, self.browser, self.cookies_file
             )
-            
-            # 生成 Markdown 文件
-            if coze_response and 'data' in coze_response:
-                coze_data = coze_response['data']
-                # 提取 summary 字段
-                summary_content = None
-                if isinstance(coze_data, dict) and 'summary' in coze_data:
-                    summary_content = coze_data['summary']
-                elif isinstance(coze_data, str):
-                    try:
-                        coze_data_dict = json.loads(coze_data)
-                        if isinstance(coze_data_dict, dict) and 'summary' in coze_data_dict:
-                            summary_content = coze_data_dict['summary']
-                    except json.JSONDecodeError:
-                        # 如果不是JSON格式，保持原样
-                        summary_content = coze_data
-                else:
-                    summary_content = str(coze_data)
-                
-                # 创建 Markdown 文件
-                md_filename = os.path.splitext(subtitle_file)[0] + '_coze_result.md'
-                with open(md_filename, 'w', encoding='utf-8') as f:
-                    # 写入 summary 内容到 Markdown 文件
-                    if summary_content:
-                        f.write(summary_content)
-                    else:
-                        f.write(str(coze_data))
-                markdown_file = md_filename
-            
-            result["coze_response"] = coze_response
-            
-        if markdown_file:
-            # 直接返回 Markdown 文件供下载
+        
+        # 读取原始字幕内容
+        with span('read'), open(subtitle_file, 'r', encoding='utf-8') as f:
+            subtitle_content = f.read()
+        return subtitle_file, subtitle_content
+    
+    def _fetch_subtitle(self, url):
+        """下载字幕，配置了共享后端时优先使用其他节点已下载的结果"""
+        if self.backend is None:
+            return self._download(url)
+        
+        downloaded = []
+        
+        def compute():
+            subtitle_file, subtitle_content = self._download(url)
+            downloaded.append(subtitle_file)
+            return {"file_name": os.path.basename(subtitle_file), "content": subtitle_content}
+        
+        entry = self._single_flight(f"subtitle:{self.lang}:{url}", compute)
+        if downloaded:
+            return downloaded[0], entry["content"]
+        
+        # 其他节点下载的字幕，在本地保存一份以便生成和提供 Markdown 文件
+        subtitle_file = os.path.join(SUBTITLES_DIR, entry["file_name"])
+        if not os.path.exists(subtitle_file):
+            with open(subtitle_file, 'w', encoding='utf-8') as f:
+                f.write(entry["content"])
+        return subtitle_file, entry["content"]
+    
+    def _run_coze(self, text, file_name):
+        """发送到 Coze，配置了共享后端时相同文本只调用一次工作流"""
+        def compute():
+            return send_to_coze_workflow(
+                self.workflow_id,
+                self.token,
+                text,
+                file_name,
+                session=self.session
+            )
+        
+        if self.backend is None:
+            return compute()
+        if isinstance(text, SpooledJsonText):
+            text_hash = text.hexdigest()
+        else:
+            text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        # 只缓存成功的响应，失败时其他请求可以重试
+        return self._single_flight(
+            f"coze:{self.workflow_id}:{text_hash}",
+            compute,
+            should_cache=lambda response: response.get('code', 0) == 0
+        )
+    
+    def _single_flight(self, key, compute, should_cache=None):
+        """
+        读取共享缓存，未命中时在分布式锁内计算并写入缓存
+        
+        同一个键同一时间只有一个节点执行 compute，其他节点等待锁释放后直接读取缓存。
+        """
+        cached = self.backend.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        
+        with self.backend.lock(f"lock:{key}", timeout=Config.LOCK_TIMEOUT,
+                               blocking_timeout=Config.LOCK_TIMEOUT):
+            cached = self.backend.get(key)
+            if cached is not None:
+                return json.loads(cached)
+            value = compute()
+            if should_cache is None or should_cache(value):
+                self.backend.set(key, json.dumps(value, ensure_ascii=False), ttl=Config.CACHE_TTL)
+            return value
+    
+    def process_many(self, urls):
+        """
+        依次处理多个视频，单个视频失败不会中断整个批次
+        
+        Args:
+            urls (iterable): YouTube 视频链接列表
+        
+        Returns:
+            list: 与输入顺序一致的结果字典列表，失败项为 {"status": "error", "url": ..., "error": ...}
+        """
+        results = []
+        for url in urls:
             try:
-                return send_file(
-                    markdown_file, 
-                    as_attachment=True, 
-                    download_name=os.path.basename(markdown_file),
-                    mimetype='text/markdown'
-                )
+                results.append(self.process(url))
             except Exception as e:
-                # 如果发送文件失败，尝试读取并返回
-                try:
-                    with open(markdown_file, 'rb') as f:
-                        content = f.read()
-                    response = Response(content, mimetype='text/markdown')
-                    response.headers['Content-Disposition'] = f'attachment; filename={os.path.basename(markdown_file)}'
-                    return response
-                except Exception as inner_e:
-                    return jsonify({"error": f"无法返回文件: {str(inner_e)}"}), 500
+                results.append({"status": "error", "url": url, "error": str(e)})
+        return results
+
+def pipeline_from_request(data, backend=None):
+    """
+    根据 /download-subtitle 的请求参数创建流水线
+    
+    Args:
+        data (dict): 请求参数（url、lang、browser、cookies_file、clean_text、send_to_coze、workflow_id、token）
+        backend: 共享后端，可选
+    
+    Returns:
+        SubtitlePipeline: 流水线实例
+    """
+    return SubtitlePipeline(
+        lang=data.get('lang', 'en'),
+        browser=data.get('browser'),  # 浏览器名称，如 'chrome', 'firefox'
+        cookies_file=data.get('cookies_file'),  # cookies 文件路径
+        # Coze 配置（如果未在配置文件中设置）
+        workflow_id=data.get('workflow_id', Config.COZE_WORKFLOW_ID),
+        token=data.get('token', Config.COZE_TOKEN),
+        clean_text=data.get('clean_text', True),  # 是否清洗文本
+        send_to_coze=data.get('send_to_coze', True),  # 是否发送到 Coze
+        include_original=True,
+        backend=backend
+    )
+
+def _parse_request_data():
+    """
+    解析请求体 JSON 并校验参数
+    
+    Returns:
+        tuple: (请求参数字典, 错误响应)，校验通过时错误响应为 None
+    """
+    data = request.json
+    if data is None:
+        logger.warning("request.json 为 None，尝试解析原始数据")
+        if request.data:
+            try:
+                data = json.loads(request.data)
+            except json.JSONDecodeError as e:
+                logger.warning("无法解析 JSON 数据: %s", e)
+                return None, (jsonify({"error": f"无效的 JSON 数据: {str(e)}"}), 400)
+        else:
+            return None, (jsonify({"error": "请求体为空"}), 400)
+    
+    logger.debug("请求数据: %s", lazy(redact, data))
+    
+    error = request_data_error(data)
+    if error:
+        return None, (jsonify(error), 400)
+    return data, None
+
+def request_data_error(data):
+    """
+    校验 /download-subtitle 的请求参数（同步和异步服务共用）
+    
+    Args:
+        data (dict): 请求参数
+    
+    Returns:
+        dict: 错误响应内容，校验通过时返回 None
+    """
+    if not isinstance(data, dict) or not data.get('url'):
+        return {"error": "缺少视频 URL"}
+    
+    # 检查是否需要发送到 Coze 但没有配置信息
+    workflow_id = data.get('workflow_id', Config.COZE_WORKFLOW_ID)
+    token = data.get('token', Config.COZE_TOKEN)
+    if data.get('send_to_coze', True) and not (workflow_id and token):
+        return {
+            "error": "未配置 Coze 工作流信息",
+            "message": "请在配置文件中设置 Coze 工作流 ID 和 Token，或在请求中提供"
+        }
+    return None
+
+@app.route('/download-subtitle', methods=['POST'])
+def handle_download_request():
+    """
+    处理下载字幕的请求
+    """
+    try:
+        logger.info("收到 /download-subtitle 请求: method=%s content_type=%s",
+                    request.method, request.content_type)
+        
+        data, error_response = _parse_request_data()
+        if error_response:
+            return error_response
+        
+        # 下载、清洗并发送到 Coze 工作流；流式处理时峰值内存不随字幕文件大小增长
+        stream = data.get('stream', Config.STREAM_RESPONSES)
+        with pipeline_from_request(data, BACKEND) as pipeline:
+            if stream:
+                result = pipeline.process_stream(data['url'])
+            else:
+                result = pipeline.process(data['url'])
+        markdown_file = result.get("markdown_file")
+        
+        if markdown_file:
+            if isinstance(result.get("cleaned_text"), SpooledJsonText):
+                result["cleaned_text"].close()
+            # 直接返回 Markdown 文件供下载；文件内容在视图返回后才由 WSGI 服务器（或 nginx）发送，
+            # 这里只能记录构造响应的耗时
+            with span('prepare_file'):
+                return serve_stored_file(markdown_file)
         
         # 如果没有生成 Markdown 文件，返回 JSON 结果
-        return jsonify(result)
+        with span('serialize'):
+            if stream:
+                return stream_json_response(result)
+            return jsonify(result)
         
     except Exception as e:
-        # 打印异常信息以便调试
-        print(f"\n{'='*60}")
-        print(f"异常发生在 /download-subtitle 端点:")
-        print(f"异常类型: {type(e).__name__}")
-        print(f"异常信息: {str(e)}")
-        print(f"\n完整堆栈跟踪:")
-        traceback.print_exc()
-        print(f"{'='*60}\n")
+        # 记录异常及完整堆栈以便调试
+        logger.exception("异常发生在 /download-subtitle 端点: %s: %s", type(e).__name__, e)
         return jsonify({"error": str(e)}), 500
 
+def stream_json_response(result):
+    """
+    以流式 JSON 响应返回 process_stream 的结果，cleaned_text 从缓冲区按块发送，发送完毕后关闭缓冲区
+    
+    Args:
+        result (dict): SubtitlePipeline.process_stream 的结果
+    
+    Returns:
+        Response: Flask 响应
+    """
+    spool = result.get("cleaned_text")
+    if not isinstance(spool, SpooledJsonText):
+        return jsonify(result)
+    body = SpooledJsonDocument(result, spool)
+    response = Response(iter(body), mimetype='application/json')
+    response.headers['Content-Length'] = str(len(body))
+    response.call_on_close(spool.close)
+    return response
+
+# 按扩展名确定下载文件的 Content-Type
+STORED_FILE_MIMETYPES = {
+    '.md': 'text/markdown',
+    '.vtt': 'text/vtt',
+}
+
+@functools.lru_cache(maxsize=1024)
+def _content_etag(path, size, mtime_ns):
+    """按文件内容计算 ETag；以大小和修改时间作为缓存键，文件不变时不重复读取"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+def file_etag(path):
+    """
+    获取文件的内容哈希 ETag
+    
+    Args:
+        path (str): 文件路径
+    
+    Returns:
+        str: ETag（不含引号）
+    """
+    stat = os.stat(path)
+    return _content_etag(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+def _content_disposition(download_name):
+    try:
+        download_name.encode('ascii')
+        return f'attachment; filename="{download_name}"'
+    except UnicodeEncodeError:
+        # 非 ASCII 文件名按 RFC 6266 编码
+        return f"attachment; filename*=UTF-8''{quote(download_name)}"
+
+def serve_stored_file(path, download_name=None):
+    """
+    以附件形式返回字幕目录中的文件，支持条件请求和断点续传
+    
+    - ETag 为文件内容哈希，配合 Last-Modified 对 If-None-Match / If-Modified-Since 返回 304
+    - 支持 Range 请求（206），Cache-Control 的 max-age 由 FILE_CACHE_MAX_AGE 控制
+    - 配置 X_ACCEL_REDIRECT_PREFIX 时交给 nginx 通过 X-Accel-Redirect 发送；
+      USE_X_SENDFILE 时交给前端服务器通过 X-Sendfile 发送；
+      否则由 WSGI 服务器的 file_wrapper 发送（支持时使用内核 sendfile），不会把整个文件读入内存
+    
+    Args:
+        path (str): 文件路径
+        download_name (str): 下载文件名，默认为文件名
+    
+    Returns:
+        Response: Flask 响应
+    """
+    # send_file 会把相对路径解析到应用目录，这里统一使用绝对路径
+    path = os.path.abspath(path)
+    download_name = download_name or os.path.basename(path)
+    mimetype = STORED_FILE_MIMETYPES.get(os.path.splitext(path)[1].lower())
+    etag = file_etag(path)
+    
+    if Config.X_ACCEL_REDIRECT_PREFIX:
+        mtime = datetime.fromtimestamp(int(os.path.getmtime(path)), timezone.utc)
+        response = Response(mimetype=mimetype or 'application/octet-stream')
+        response.set_etag(etag)
+        response.last_modified = mtime
+        response.cache_control.max_age = Config.FILE_CACHE_MAX_AGE
+        response.cache_control.public = True
+        if not is_resource_modified(request.environ, etag=etag, last_modified=mtime):
+            response.status_code = 304
+            return response
+        relative = os.path.relpath(path, os.path.abspath(SUBTITLES_DIR)).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = Config.X_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(relative)
+        response.headers['Content-Disposition'] = _content_disposition(download_name)
+        return response
+    
+    return send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+        max_age=Config.FILE_CACHE_MAX_AGE
+    )
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
@@ -422,27 +1041,221 @@ def download_markdown():
     if not filename:
         return jsonify({"error": "缺少文件名参数"}), 400
     
-    filepath = os.path.join(Config.SUBTITLES_DIR, filename)
-    if not os.path.exists(filepath):
+    # safe_join 拒绝 ../ 等越出字幕目录的路径
+    filepath = safe_join(SUBTITLES_DIR, filename)
+    if filepath is None or not os.path.isfile(filepath):
         return jsonify({"error": "文件不存在"}), 404
     
     try:
-        return send_file(filepath, as_attachment=True, download_name=filename)
+        return serve_stored_file(filepath)
+    except HTTPException:
+        # 例如 416 Range Not Satisfiable
+        raise
+    except Exception as e:
+        return jsonify({"error": f"无法发送文件: {str(e)}"}), 500
+
+@app.route('/export', methods=['GET'])
+def export_transcripts():
+    """
+    以压缩列式格式流式导出所有字幕
+    
+    参数: table=cues|videos（默认 cues），format=arrow|parquet（默认 arrow），
+    since=Unix 时间戳（可选，只导出之后修改的字幕）
+    """
+    from export import stream_export, FORMATS, TABLES
+    
+    table = request.args.get('table', 'cues')
+    fmt = request.args.get('format', 'arrow')
+    if table not in TABLES or fmt not in FORMATS:
+        return jsonify({"error": f"table 须为 {'/'.join(TABLES)}，format 须为 {'/'.join(FORMATS)}"}), 400
+    try:
+        since = float(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        return jsonify({"error": "since 须为 Unix 时间戳"}), 400
+    
+    try:
+        chunks = stream_export(SUBTITLES_DIR, table, fmt, since=since)
+        # 先取第一块，让缺少 pyarrow 等错误在发送响应头之前暴露
+        first = next(chunks)
     except Exception as e:
-        # 即使在文件传输过程中出现错误也尽量返回文件
+        logger.exception("导出失败")
+        return jsonify({"error": str(e)}), 500
+    
+    extension = 'parquet' if fmt == 'parquet' else 'arrows'
+    mimetype = 'application/vnd.apache.parquet' if fmt == 'parquet' else 'application/vnd.apache.arrow.stream'
+    response = Response(_chain_chunks(first, chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{extension}'
+    return response
+
+def _chain_chunks(first, rest):
+    yield first
+    yield from rest
+
+@app.route('/jobs', methods=['POST'])
+def submit_download_job():
+    """
+    把下载请求放入共享任务队列（参数与 /download-subtitle 相同），立即返回任务 ID
+    """
+    if BACKEND is None:
+        return jsonify({"error": "未配置共享后端", "message": "请设置 BACKEND_URL"}), 400
+    
+    data, error_response = _parse_request_data()
+    if error_response:
+        return error_response
+    
+    job_id = submit_job(BACKEND, data, ttl=Config.CACHE_TTL)
+    logger.info("任务已加入队列: job_id=%s url=%s", job_id, data['url'])
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_download_job(job_id):
+    """
+    查询任务状态：queued / running / success / error
+    """
+    if BACKEND is None:
+        return jsonify({"error": "未配置共享后端", "message": "请设置 BACKEND_URL"}), 400
+    
+    job = get_job(BACKEND, job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job)
+
+# 共享后端出错时 worker 重试的最长间隔（秒）
+WORKER_MAX_BACKOFF = 30
+
+def run_worker(backend, stop_event=None, poll_timeout=5, worker_id=None):
+    """
+    从共享任务队列中取出任务并处理，直到 stop_event 被设置
+    
+    多个节点可以同时运行 worker，每个任务只会被一个 worker 取出。取出的任务先放入该 worker 的
+    处理中列表，处理完成后才确认删除；worker 在后台定期刷新心跳，进程退出导致心跳过期后，
+    其他 worker 会把它处理中的任务放回队列重新处理。
+    
+    Args:
+        backend: 共享后端
+        stop_event (threading.Event): 可选的停止信号
+        poll_timeout (float): 每次等待队列的最长时间（秒）
+        worker_id (str): worker 标识，默认由主机名、进程号和随机后缀组成
+    """
+    stop_event = stop_event or threading.Event()
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    heartbeat_ttl = Config.WORKER_HEARTBEAT_TTL
+    
+    # 处理耗时较长的任务时也要保持心跳；后端暂时不可用时尽快重试，避免心跳过期后任务被其他 worker 重复处理
+    def beat():
+        """刷新心跳，返回距下次刷新的间隔"""
         try:
-            with open(filepath, 'rb') as f:
-                content = f.read()
-            response = Response(content, mimetype='text/markdown')
-            response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-            return response
-        except Exception as inner_e:
-            return jsonify({"error": f"无法读取或发送文件: {str(inner_e)}"}), 500
+            backend.heartbeat(JOB_QUEUE, worker_id, heartbeat_ttl)
+            return heartbeat_ttl / 3
+        except Exception:
+            logger.exception("刷新 worker %s 的心跳失败，稍后重试", worker_id)
+            return min(1, heartbeat_ttl / 3)
+    
+    stop_heartbeat = threading.Event()
+    def keep_alive(interval):
+        while not stop_heartbeat.wait(interval):
+            interval = beat()
+    heartbeat_thread = threading.Thread(target=keep_alive, args=(beat(),),
+                                        name=f"heartbeat-{worker_id}", daemon=True)
+    heartbeat_thread.start()
+    
+    # 后端出错（如 Redis 连接断开）时记录日志并退避重试，worker 线程不会退出
+    error_delay = 0
+    try:
+        while not stop_event.is_set():
+            try:
+                requeued = backend.requeue_stale(JOB_QUEUE)
+                if requeued:
+                    logger.warning("已把 %d 个已退出 worker 未完成的任务放回队列", requeued)
+                raw = backend.reserve(JOB_QUEUE, worker_id, timeout=poll_timeout)
+            except Exception:
+                error_delay = min(error_delay * 2 or 1, WORKER_MAX_BACKOFF)
+                logger.exception("读取任务队列失败，%s 秒后重试", error_delay)
+                stop_event.wait(error_delay)
+                continue
+            error_delay = 0
+            if raw is None:
+                continue
+            try:
+                _run_job(backend, json.loads(raw), worker_id)
+            except Exception:
+                logger.exception("记录任务状态失败: %s", raw)
+            finally:
+                try:
+                    backend.ack(JOB_QUEUE, worker_id, raw)
+                except Exception:
+                    # 未确认的任务留在处理中列表，本 worker 退出、心跳过期后会被重新处理
+                    logger.exception("确认任务失败: %s", raw)
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+
+def _run_job(backend, job, worker_id):
+    job_id = job["job_id"]
+    data = job["request"]
+    started_at = time.time()
+    update_job(backend, job_id, {"status": "running", "url": data.get('url'),
+                                 "worker": worker_id, "started_at": started_at},
+               ttl=Config.CACHE_TTL)
+    try:
+        with trace_context(job_id) as trace, pipeline_from_request(data, backend) as pipeline:
+            result = pipeline.process(data['url'])
+        # 任务记录中不保存原始字幕，需要时可从字幕缓存读取
+        result.pop("original_content", None)
+        update_job(backend, job_id, {"status": "success", "url": data.get('url'), "result": result,
+                                     "spans": trace.spans, "started_at": started_at},
+                   ttl=Config.CACHE_TTL)
+    except Exception as e:
+        logger.exception("处理任务 %s 失败", job_id)
+        update_job(backend, job_id, {"status": "error", "url": data.get('url'), "error": str(e),
+                                     "started_at": started_at},
+                   ttl=Config.CACHE_TTL)
+
+def start_worker_threads(backend, count):
+    """在当前进程中启动 count 个后台 worker 线程"""
+    threads = []
+    for index in range(count):
+        thread = threading.Thread(target=run_worker, args=(backend,), name=f"job-worker-{index}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+def run_cli(url, lang='en'):
+    """
+    命令行模式处理单个视频，打印清洗后的文本和 Coze 响应
+    
+    Args:
+        url (str): YouTube 视频链接
+        lang (str): 字幕语言，默认为 'en'
+    
+    Returns:
+        dict: SubtitlePipeline.process 的结果
+    """
+    print(f"正在下载字幕: {url}")
+    with SubtitlePipeline(lang=lang, backend=BACKEND) as pipeline:
+        result = pipeline.process(url)
+    print(f"字幕下载完成: {result['subtitle_file']}")
+    
+    print("\n清洗后的文本:")
+    print("=" * 50)
+    print(result["cleaned_text"])
+    print("=" * 50)
+    
+    if pipeline.send_to_coze:
+        print("Coze 工作流响应:")
+        print(json.dumps(result["coze_response"], indent=2, ensure_ascii=False))
+        if "markdown_file" in result:
+            print(f"\nCoze 结果已保存到 Markdown 文件: {result['markdown_file']}")
+    else:
+        print("\n提示: 如需发送到 Coze 工作流，请配置 workflow_id 和 token")
+    return result
 
 def main(url=None, lang='en', return_result=False):
     """
     主函数 - 可以直接运行或通过 API 调用
     
+    程序化批量调用请使用 SubtitlePipeline，它只在构造时读取一次配置且不输出到控制台。
+    
     Args:
         url (str): YouTube 视频链接（可选，用于程序化调用）
         lang (str): 字幕语言，默认为 'en'
@@ -453,79 +1266,15 @@ def main(url=None, lang='en', return_result=False):
     """
     # 尝试从文件加载 Coze 配置
     Config.load_from_file()
+    configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT)
     
     # 如果直接传入了 URL 参数，使用程序化调用模式
     if url:
         try:
-            print(f"正在下载字幕: {url}")
-            subtitle_file = download_subtitle(url, lang)
-            print(f"字幕下载完成: {subtitle_file}")
-            
-            # 读取并清洗字幕内容
-            with open(subtitle_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                cleaned_content = clean_subtitle_content(content)
-                
-            print("\n清洗后的文本:")
-            print("=" * 50)
-            print(cleaned_content)
-            print("=" * 50)
-            
-            result = {
-                "status": "success",
-                "subtitle_file": subtitle_file,
-                "cleaned_text": cleaned_content
-            }
-            
-            # 如果配置了 Coze，则发送到工作流
-            if Config.is_coze_configured():
-                print("\n正在发送到 Coze 工作流...")
-                coze_response = send_to_coze_workflow(
-                    Config.COZE_WORKFLOW_ID,
-                    Config.COZE_TOKEN,
-                    cleaned_content,
-                    os.path.basename(subtitle_file)
-                )
-                print("Coze 工作流响应:")
-                print(json.dumps(coze_response, indent=2, ensure_ascii=False))
-                
-                result["coze_response"] = coze_response
-                
-                # 生成 Markdown 文件
-                if coze_response and 'data' in coze_response:
-                    coze_data = coze_response['data']
-                    # 提取 summary 字段
-                    summary_content = None
-                    if isinstance(coze_data, dict) and 'summary' in coze_data:
-                        summary_content = coze_data['summary']
-                    elif isinstance(coze_data, str):
-                        try:
-                            coze_data_dict = json.loads(coze_data)
-                            if isinstance(coze_data_dict, dict) and 'summary' in coze_data_dict:
-                                summary_content = coze_data_dict['summary']
-                        except json.JSONDecodeError:
-                            # 如果不是JSON格式，保持原样
-                            summary_content = coze_data
-                    else:
-                        summary_content = str(coze_data)
-                    
-                    # 创建 Markdown 文件
-                    md_filename = os.path.splitext(subtitle_file)[0] + '_coze_result.md'
-                    with open(md_filename, 'w', encoding='utf-8') as f:
-                        # 写入 summary 内容到 Markdown 文件
-                        if summary_content:
-                            f.write(summary_content)
-                        else:
-                            f.write(str(coze_data))
-                    print(f"\nCoze 结果已保存到 Markdown 文件: {md_filename}")
-                    result["markdown_file"] = md_filename
-            else:
-                print("\n提示: 如需发送到 Coze 工作流，请配置 workflow_id 和 token")
-            
+            result = run_cli(url, lang)
             # 如果需要返回结果，返回字典
             if return_result:
                 return result
-            
         except Exception as e:
             print(f"错误: {e}")
             if return_result:
@@ -538,62 +1287,7 @@ def main(url=None, lang='en', return_result=False):
         lang = sys.argv[2] if len(sys.argv) > 2 else 'en'
         
         try:
-            print(f"正在下载字幕: {url}")
-            subtitle_file = download_subtitle(url, lang)
-            print(f"字幕下载完成: {subtitle_file}")
-            
-            # 读取并清洗字幕内容
-            with open(subtitle_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                cleaned_content = clean_subtitle_content(content)
-                
-            print("\n清洗后的文本:")
-            print("=" * 50)
-            print(cleaned_content)
-            print("=" * 50)
-            
-            # 如果配置了 Coze，则发送到工作流
-            if Config.is_coze_configured():
-                print("\n正在发送到 Coze 工作流...")
-                coze_response = send_to_coze_workflow(
-                    Config.COZE_WORKFLOW_ID,
-                    Config.COZE_TOKEN,
-                    cleaned_content,
-                    os.path.basename(subtitle_file)
-                )
-                print("Coze 工作流响应:")
-                print(json.dumps(coze_response, indent=2, ensure_ascii=False))
-                
-                # 生成 Markdown 文件
-                if coze_response and 'data' in coze_response:
-                    coze_data = coze_response['data']
-                    # 提取 summary 字段
-                    summary_content = None
-                    if isinstance(coze_data, dict) and 'summary' in coze_data:
-                        summary_content = coze_data['summary']
-                    elif isinstance(coze_data, str):
-                        try:
-                            coze_data_dict = json.loads(coze_data)
-                            if isinstance(coze_data_dict, dict) and 'summary' in coze_data_dict:
-                                summary_content = coze_data_dict['summary']
-                        except json.JSONDecodeError:
-                            # 如果不是JSON格式，保持原样
-                            summary_content = coze_data
-                    else:
-                        summary_content = str(coze_data)
-                    
-                    # 创建 Markdown 文件
-                    md_filename = os.path.splitext(subtitle_file)[0] + '_coze_result.md'
-                    with open(md_filename, 'w', encoding='utf-8') as f:
-                        # 写入 summary 内容到 Markdown 文件
-                        if summary_content:
-                            f.write(summary_content)
-                        else:
-                            f.write(str(coze_data))
-                    print(f"\nCoze 结果已保存到 Markdown 文件: {md_filename}")
-            else:
-                print("\n提示: 如需发送到 Coze 工作流，请配置 workflow_id 和 token")
-                
+            run_cli(url, lang)
         except Exception as e:
             print(f"错误: {e}")
             sys.exit(1)
@@ -603,13 +1297,19 @@ def main(url=None, lang='en', return_result=False):
         print("API 端点:")
         print("  POST /download-subtitle - 下载字幕")
         print("  GET  /health           - 健康检查")
+        if BACKEND is not None:
+            print("  POST /jobs             - 提交任务到共享队列")
+            print("  GET  /jobs/<job_id>    - 查询任务状态")
+            if Config.WORKER_THREADS > 0:
+                start_worker_threads(BACKEND, Config.WORKER_THREADS)
+                print(f"  已启动 {Config.WORKER_THREADS} 个任务 worker 线程")
         if Config.is_coze_configured():
             print(f"  Coze 工作流已配置 (ID: {Config.COZE_WORKFLOW_ID[:10]}...)")
         else:
             print("  Coze 工作流未配置")
         # 根据环境变量决定是否启用 debug 模式
         debug_mode = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
-        app.run(host='0.0.0.0', port=5001, debug=debug_mode)
+        app.run(host=Config.HOST, port=Config.PORT, debug=debug_mode)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+内存基准：比较 /download-subtitle 一次性处理和流式处理的峰值内存
+功能：
+1. 生成不同长度的 VTT 字幕文件（模拟长达十几小时的直播）
+2. 用 tracemalloc 测量读取、清洗、构造 Coze 请求体和 JSON 响应体这几步的峰值内存
+3. 一次性处理的峰值随文件大小线性增长，流式处理的峰值应保持平稳（约为 SPOOL_MAX_SIZE）
+
+用法:
+    python membench.py                          # 默认 1 万 / 5 万 / 20 万个字幕块
+    python membench.py --cues 10000 400000 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from main import clean_subtitle_content, clean_subtitle_file, build_coze_request, SpooledJsonDocument
+
+def write_sample_vtt(path, cues):
+    """
+    写出包含 cues 个字幕块的 VTT 文件，每块两行文本
+
+    Returns:
+        int: 文件大小（字节）
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("WEBVTT\nKind: captions\nLanguage: en\n\n")
+        for i in range(cues):
+            start, end = i * 2, i * 2 + 2
+            f.write(f"{start // 3600:02d}:{start // 60 % 60:02d}:{start % 60:02d}.000 --> "
+                    f"{end // 3600:02d}:{end // 60 % 60:02d}:{end % 60:02d}.000\n")
+            f.write(f"cue {i} of a very long live stream with some&nbsp;\nwrapped caption text\n\n")
+    return os.path.getsize(path)
+
+def in_memory_request(path):
+    """一次性处理：读入全文、清洗为字符串、序列化 Coze 请求体和包含原文的 JSON 响应"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    cleaned_text = clean_subtitle_content(content)
+    _, _, payload = build_coze_request("1", "token", cleaned_text)
+    request_body = json.dumps(payload).encode('utf-8')
+    response_body = json.dumps({"status": "success", "original_content": content,
+                                "cleaned_text": cleaned_text}).encode('utf-8')
+    return len(request_body) + len(response_body)
+
+def streaming_request(path):
+    """流式处理：逐行清洗到缓冲区，按块产出 Coze 请求体和 JSON 响应"""
+    with clean_subtitle_file(path) as spool:
+        _, _, payload = build_coze_request("1", "token", spool)
+        total = sum(len(chunk) for chunk in SpooledJsonDocument(payload, spool))
+        result = {"status": "success", "cleaned_text": spool}
+        total += sum(len(chunk) for chunk in SpooledJsonDocument(result, spool))
+    return total
+
+def measure_peak(func, *args):
+    """
+    Returns:
+        int: 调用 func 期间 Python 分配的峰值内存（字节）
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run(cue_counts):
+    """
+    Returns:
+        list: 每种长度的文件大小和两种处理方式的峰值内存
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="membench-") as work_dir:
+        for cues in cue_counts:
+            path = os.path.join(work_dir, f"{cues}.vtt")
+            size = write_sample_vtt(path, cues)
+            results.append({
+                "cues": cues,
+                "file_bytes": size,
+                "in_memory_peak": measure_peak(in_memory_request, path),
+                "streaming_peak": measure_peak(streaming_request, path),
+            })
+    return results
+
+def format_report(results):
+    lines = [f"{'cues':>8}{'file MiB':>10}{'in-memory MiB':>15}{'streaming MiB':>15}"]
+    for r in results:
+        lines.append(f"{r['cues']:>8}{r['file_bytes'] / 2**20:>10.1f}"
+                     f"{r['in_memory_peak'] / 2**20:>15.1f}{r['streaming_peak'] / 2**20:>15.1f}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="比较一次性处理和流式处理的峰值内存")
+    parser.add_argument("--cues", type=int, nargs="+", default=[10000, 50000, 200000],
+                        help="生成的字幕块数量，可指定多个")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results = run(args.cues)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_report(results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+按需性能分析：请求级采样分析器和分阶段耗时记录
+功能：
+1. 每个请求分配请求 ID（沿用合法的 X-Request-ID 请求头或自动生成），并在响应头中返回
+2. 用 span(name) 记录各阶段耗时（下载、清洗、Coze、序列化、发送文件等），通过 Server-Timing 响应头返回
+3. 按 PROFILE_SAMPLE_RATE 比例、带 X-Profile 请求头或管理接口指定时，对请求运行低开销的采样分析器，
+   结果以火焰图工具可直接读取的折叠栈格式（flamegraph.pl / speedscope）按请求 ID 保存
+
+未被采样的请求不会启动采样线程，只有 span 的计时开销。
+"""
+
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request, jsonify, send_file
+
+from config import Config
+from logging_utils import get_logger
+
+logger = get_logger("profiling")
+
+# 用 ContextVar 而不是线程局部变量，同一线程上并发的 asyncio 任务各自记录自己的耗时
+_current_trace = ContextVar('request_trace', default=None)
+
+# 客户端提供的 X-Request-ID 会用作采样结果的文件名，只接受这些字符
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def request_id_from_header(value):
+    """
+    校验客户端提供的 X-Request-ID，不合法或缺失时生成新的 ID
+
+    Args:
+        value (str): 请求头的值，可为 None
+
+    Returns:
+        str: 可以安全用作文件名的请求 ID
+    """
+    if value and REQUEST_ID_PATTERN.match(value):
+        return value
+    return uuid.uuid4().hex
+
+class RequestTrace:
+    """一次请求（或一次流水线调用）的分阶段耗时记录"""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def to_dict(self):
+        return {"request_id": self.request_id, "spans": self.spans}
+
+    def server_timing(self):
+        """格式化为 Server-Timing 响应头"""
+        return ', '.join(
+            f"{span['name']};dur={span['duration_ms']}" for span in self.spans
+        )
+
+def current_trace():
+    """当前线程（或 asyncio 任务）正在记录的 RequestTrace，没有时返回 None"""
+    return _current_trace.get()
+
+@contextmanager
+def trace_context(request_id=None):
+    """
+    在当前线程开始记录分阶段耗时（Web 请求之外使用，如批量任务）
+
+    Yields:
+        RequestTrace: 本次记录
+    """
+    trace = RequestTrace(request_id or uuid.uuid4().hex)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+@contextmanager
+def span(name):
+    """
+    记录一个阶段的耗时；当前没有 RequestTrace 时几乎没有开销
+
+    Args:
+        name (str): 阶段名称，如 'download'、'clean'、'coze'
+    """
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        finished = time.perf_counter()
+        trace.spans.append({
+            "name": name,
+            "start_ms": round((started - trace.started) * 1000, 3),
+            "duration_ms": round((finished - started) * 1000, 3),
+        })
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程按固定间隔读取目标线程的调用栈并计数
+
+    输出为折叠栈格式，每行 "根帧;...;叶帧 次数"。
+    """
+
+    def __init__(self, thread_id=None, interval=0.005, max_depth=128):
+        """
+        Args:
+            thread_id (int): 被采样的线程 ID，默认为当前线程
+            interval (float): 采样间隔（秒）
+            max_depth (int): 每个调用栈最多记录的帧数
+        """
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    .replace(';', ':')
+                )
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """
+        Returns:
+            str: 折叠栈文本
+        """
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+def save_profile(request_id, profiler, trace, meta=None, profile_dir=None):
+    """
+    按请求 ID 保存采样结果（.folded）和分阶段耗时（.json），超过 PROFILE_KEEP 个时删除最旧的
+
+    Returns:
+        str: 折叠栈文件路径
+    """
+    if not REQUEST_ID_PATTERN.match(request_id):
+        raise ValueError(f"无效的请求 ID: {request_id!r}")
+    profile_dir = profile_dir or Config.PROFILE_DIR
+    os.makedirs(profile_dir, exist_ok=True)
+    folded_path = os.path.join(profile_dir, f"{request_id}.folded")
+    with open(folded_path, 'w', encoding='utf-8') as f:
+        f.write(profiler.folded())
+    record = dict(trace.to_dict(), samples=sum(profiler.samples.values()),
+                  interval_ms=profiler.interval * 1000, **(meta or {}))
+    with open(os.path.join(profile_dir, f"{request_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+
+    saved = sorted(
+        (entry for entry in os.scandir(profile_dir) if entry.name.endswith('.folded')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in saved[:max(0, len(saved) - Config.PROFILE_KEEP)]:
+        os.remove(entry.path)
+        json_path = entry.path[:-len('.folded')] + '.json'
+        if os.path.exists(json_path):
+            os.remove(json_path)
+    return folded_path
+
+def _is_admin(token):
+    if not Config.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), Config.ADMIN_TOKEN.encode('utf-8'))
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    return header[len('Bearer '):] if header.startswith('Bearer ') else None
+
+class _ProfileBudget:
+    """管理接口设置的“接下来 N 个请求需要采样”计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+
+    def take(self):
+        with self._lock:
+            if self.remaining > 0:
+                self.remaining -= 1
+                return True
+            return False
+
+def init_profiling(app):
+    """
+    为 Flask 应用注册请求 ID、分阶段耗时、采样分析的钩子以及管理接口
+
+    管理接口（需要 Authorization: Bearer <ADMIN_TOKEN>，未设置 ADMIN_TOKEN 时不可用）:
+        POST /admin/profile           {"count": N} 对接下来 N 个请求采样
+        GET  /admin/profiles          列出已保存的采样结果
+        GET  /admin/profiles/<id>     下载某个请求的折叠栈（?format=json 返回分阶段耗时）
+    """
+    budget = _ProfileBudget()
+
+    @app.before_request
+    def _start_trace():
+        request_id = request_id_from_header(request.headers.get('X-Request-ID'))
+        g.request_id = request_id
+        _current_trace.set(RequestTrace(request_id))
+        g.profiler = None
+        wanted = (
+            _is_admin(request.headers.get('X-Profile'))
+            or (Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE)
+            or budget.take()
+        )
+        if wanted and not request.path.startswith('/admin/'):
+            g.profiler = SamplingProfiler(interval=Config.PROFILE_INTERVAL_MS / 1000).start()
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = current_trace()
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        profiler = g.get('profiler')
+        if profiler is not None:
+            profiler.stop()
+            g.profiler = None
+            try:
+                save_profile(trace.request_id, profiler, trace,
+                             meta={"path": request.path, "method": request.method,
+                                   "status": response.status_code})
+                response.headers['X-Profile-Id'] = trace.request_id
+            except Exception:
+                logger.exception("保存采样结果失败")
+        if trace is not None and trace.spans:
+            response.headers['Server-Timing'] = trace.server_timing()
+        return response
+
+    @app.teardown_request
+    def _clear_trace(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+        _current_trace.set(None)
+
+    @app.route('/admin/profile', methods=['POST'])
+    def admin_profile_next():
+        if not _is_admin(_bearer_token()):
+            return jsonify({"error": "未授权"}), 403
+        data = request.get_json(silent=True) or {}
+        count = int(data.get('count', 1))
+        with budget._lock:
+            budget.remaining = max(0, count)
+        return jsonify({"status": "ok", "remaining": budget.remaining})
+
+    @app.route('/admin/profiles', methods=['GET'])
+    def admin_list_profiles():
+        if not _is_admin(_bearer_token()):
+            return jsonify({"error": "未授权"}), 403
+        if not os.path.isdir(Config.PROFILE_DIR):
+            return jsonify({"profiles": []})
+        entries = sorted(
+            (entry for entry in os.scandir(Config.PROFILE_DIR) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime, reverse=True
+        )
+        return jsonify({"profiles": [entry.name[:-len('.json')] for entry in entries]})
+
+    @app.route('/admin/profiles/<request_id>', methods=['GET'])
+    def admin_get_profile(request_id):
+        if not _is_admin(_bearer_token()):
+            return jsonify({"error": "未授权"}), 403
+        extension = 'json' if request.args.get('format') == 'json' else 'folded'
+        path = os.path.abspath(os.path.join(Config.PROFILE_DIR, f"{os.path.basename(request_id)}.{extension}"))
+        if not os.path.isfile(path):
+            return jsonify({"error": "采样结果不存在"}), 404
+        return send_file(path, mimetype='application/json' if extension == 'json' else 'text/plain')
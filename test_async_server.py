@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+测试异步服务：直接调用 ASGI 应用，yt-dlp 和 Coze 使用压测工具中的替身
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+import main
+import async_server
+from config import Config
+from loadtest import CozeStubServer
+
+CONTENT = "# 摘要\n\n异步服务返回的摘要。\n".encode("utf-8")
+
+def call(app, method, path, query=b"", body=b"", headers=None):
+    """发送一个请求，返回 (状态码, 响应头, 响应体)"""
+    async def run():
+        return await request(app, method, path, query, body, headers)
+    return asyncio.run(run())
+
+async def request(app, method, path, query=b"", body=b"", headers=None):
+    messages = []
+    delivered = False
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    await app(scope, receive, send)
+    start = messages[0]
+    response_headers = {k.decode().lower(): v.decode() for k, v in start["headers"]}
+    return start["status"], response_headers, b"".join(m.get("body", b"") for m in messages[1:])
+
+@pytest.fixture
+def subtitles_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "subtitles"
+    directory.mkdir()
+    monkeypatch.setattr(main, "SUBTITLES_DIR", str(directory))
+    return directory
+
+def test_health():
+    status, headers, body = call(async_server.AsyncSubtitleApp(), "GET", "/health")
+    assert status == 200
+    assert json.loads(body)["status"] == "healthy"
+    assert headers["x-request-id"]
+
+def test_download_markdown_conditional(subtitles_dir):
+    (subtitles_dir / "video [abc].en_coze_result.md").write_bytes(CONTENT)
+    app = async_server.AsyncSubtitleApp()
+    query = b"file=video%20%5Babc%5D.en_coze_result.md"
+
+    status, headers, body = call(app, "GET", "/download-markdown", query)
+    assert status == 200
+    assert body == CONTENT
+    assert headers["content-type"].startswith("text/markdown")
+
+    status, _, body = call(app, "GET", "/download-markdown", query,
+                           headers={"If-None-Match": headers["etag"]})
+    assert status == 304
+    assert body == b""
+
+    status, _, _ = call(app, "GET", "/download-markdown", b"file=../config.py")
+    assert status == 404
+
+def test_download_markdown_range(subtitles_dir):
+    (subtitles_dir / "video [abc].en_coze_result.md").write_bytes(CONTENT)
+    app = async_server.AsyncSubtitleApp()
+    query = b"file=video%20%5Babc%5D.en_coze_result.md"
+
+    status, headers, body = call(app, "GET", "/download-markdown", query, headers={"Range": "bytes=0-7"})
+    assert status == 206
+    assert body == CONTENT[:8]
+    assert headers["content-range"] == f"bytes 0-7/{len(CONTENT)}"
+    assert headers["content-length"] == "8"
+
+    status, _, body = call(app, "GET", "/download-markdown", query, headers={"Range": "bytes=-5"})
+    assert status == 206
+    assert body == CONTENT[-5:]
+
+    status, headers, body = call(app, "GET", "/download-markdown", query,
+                                 headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert status == 416
+    assert headers["content-range"] == f"bytes */{len(CONTENT)}"
+    assert body == b""
+
+    # If-Range 与当前 ETag 不一致时返回完整文件
+    status, _, body = call(app, "GET", "/download-markdown", query,
+                           headers={"Range": "bytes=0-7", "If-Range": '"stale"'})
+    assert status == 200
+    assert body == CONTENT
+
+def test_download_subtitle_without_coze(subtitles_dir, fake_ytdlp):
+    fake_ytdlp.configure(cues=3)
+    body = json.dumps({"url": "https://www.youtube.com/watch?v=abc", "send_to_coze": False}).encode()
+    status, headers, response = call(async_server.AsyncSubtitleApp(), "POST", "/download-subtitle",
+                                     body=body, headers={"Content-Type": "application/json"})
+    assert status == 200
+    result = json.loads(response)
+    assert result["status"] == "success"
+    assert os.path.dirname(result["subtitle_file"]) == str(subtitles_dir)
+    assert result["cleaned_text"].startswith("cue 0 of video abc with some wrapped caption text")
+    assert "download;dur=" in headers["server-timing"]
+    # 临时下载目录已清理
+    assert os.listdir(subtitles_dir) == ["abc.en.vtt"]
+
+def test_concurrent_downloads_do_not_block(subtitles_dir, fake_ytdlp):
+    fake_ytdlp.configure(cues=3, delay=1)
+    app = async_server.AsyncSubtitleApp()
+
+    async def run():
+        bodies = [
+            json.dumps({"url": f"https://www.youtube.com/watch?v=v{i}", "send_to_coze": False}).encode()
+            for i in range(10)
+        ]
+        return await asyncio.gather(*(request(app, "POST", "/download-subtitle", body=b) for b in bodies))
+
+    started = time.monotonic()
+    responses = asyncio.run(run())
+    assert time.monotonic() - started < 5
+    for index, (status, _, body) in enumerate(responses):
+        assert status == 200
+        # 并发下载时每个请求拿到的都是自己的字幕文件
+        assert os.path.basename(json.loads(body)["subtitle_file"]) == f"v{index}.en.vtt"
+
+def test_missing_url():
+    status, _, body = call(async_server.AsyncSubtitleApp(), "POST", "/download-subtitle", body=b"{}")
+    assert status == 400
+    assert json.loads(body)["error"] == "缺少视频 URL"
+
+def test_download_subtitle_with_coze(subtitles_dir, fake_ytdlp, monkeypatch):
+    fake_ytdlp.configure(cues=3)
+    pytest.importorskip("httpx")
+    with CozeStubServer() as coze:
+        monkeypatch.setattr(Config, "COZE_API_BASE_URL", coze.url)
+        app = async_server.AsyncSubtitleApp()
+
+        async def run():
+            try:
+                body = json.dumps({"url": "https://www.youtube.com/watch?v=abc",
+                                   "workflow_id": "1", "token": "test"}).encode()
+                return await request(app, "POST", "/download-subtitle", body=body)
+            finally:
+                await app.aclose()
+
+        status, headers, body = asyncio.run(run())
+    assert status == 200
+    assert headers["content-type"].startswith("text/markdown")
+    assert "coze;dur=" in headers["server-timing"]
+    assert body
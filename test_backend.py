@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+测试共享后端：缓存、单飞锁、任务队列，以及 SubtitlePipeline 在多个“节点”间共享结果
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import pytest
+
+import main
+from backend import MemoryBackend, RedisBackend, LockTimeout, JOB_QUEUE, submit_job, get_job
+
+def test_memory_backend_basics():
+    backend = MemoryBackend()
+    backend.set("a", "1", ttl=0.05)
+    assert backend.get("a") == "1"
+    time.sleep(0.06)
+    assert backend.get("a") is None
+
+    backend.push("q", "x")
+    backend.push("q", "y")
+    assert backend.pop("q", timeout=0.1) == "x"
+    assert backend.pop("q", timeout=0.1) == "y"
+    assert backend.pop("q", timeout=0.05) is None
+
+    with backend.lock("l"):
+        holder = []
+        thread = threading.Thread(target=lambda: holder.append(
+            _try_lock(backend, "l", blocking_timeout=0.05)))
+        thread.start()
+        thread.join()
+        assert holder == [False]
+    assert backend._locks == {}
+
+def _try_lock(backend, name, blocking_timeout):
+    try:
+        with backend.lock(name, blocking_timeout=blocking_timeout):
+            return True
+    except LockTimeout:
+        return False
+
+def test_pipelines_share_downloads_and_coze_results(tmp_path, monkeypatch, fake_ytdlp):
+    (tmp_path / "subs").mkdir()
+    fake_ytdlp.configure(delay=0.2, vtt="WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nshared text\n")
+    monkeypatch.setattr(main, "SUBTITLES_DIR", str(tmp_path / "subs"))
+    coze_calls = []
+    monkeypatch.setattr(main, "send_to_coze_workflow",
+                        lambda workflow_id, token, text, file_name, session=None:
+                        coze_calls.append(text) or {"code": 0, "data": '{"summary": "s"}'})
+
+    backend = MemoryBackend()
+    url = "https://www.youtube.com/watch?v=same"
+    results = []
+
+    def node():
+        pipeline = main.SubtitlePipeline(workflow_id="1", token="t", backend=backend)
+        results.append(pipeline.process(url))
+
+    # 模拟多个节点同时请求同一个视频
+    threads = [threading.Thread(target=node) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 4
+    assert all(r["cleaned_text"] == "shared text" for r in results)
+    assert fake_ytdlp.calls() == [url]
+    assert coze_calls == ["shared text"]
+
+def test_concurrent_distinct_downloads_get_their_own_subtitles(tmp_path, monkeypatch, fake_ytdlp):
+    (tmp_path / "subs").mkdir()
+    fake_ytdlp.configure(delay=0.2, vtt="WEBVTT\n\n00:00:00.000 --> 00:00:01.000\ntext of {video_id}\n")
+    monkeypatch.setattr(main, "SUBTITLES_DIR", str(tmp_path / "subs"))
+    backend = MemoryBackend()
+    results = {}
+
+    def worker(video_id):
+        pipeline = main.SubtitlePipeline(send_to_coze=False, backend=backend)
+        results[video_id] = pipeline.process(f"https://www.youtube.com/watch?v={video_id}")
+
+    # 模拟同一进程中多个工作线程同时处理不同的视频
+    threads = [threading.Thread(target=worker, args=(f"vid{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i in range(8):
+        video_id = f"vid{i}"
+        assert results[video_id]["cleaned_text"] == f"text of {video_id}"
+        assert os.path.basename(results[video_id]["subtitle_file"]) == f"{video_id}.en.vtt"
+        cached = json.loads(backend.get(f"subtitle:en:https://www.youtube.com/watch?v={video_id}"))
+        assert cached["file_name"] == f"{video_id}.en.vtt"
+    # 临时下载目录已清理
+    assert sorted(os.listdir(tmp_path / "subs")) == [f"vid{i}.en.vtt" for i in range(8)]
+
+def test_job_queue_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(main.SubtitlePipeline, "process",
+                        lambda self, url: {"status": "success", "url": url, "original_content": "raw"})
+    backend = MemoryBackend()
+    job_id = submit_job(backend, {"url": "u", "send_to_coze": False, "token": "secret"})
+    assert get_job(backend, job_id)["status"] == "queued"
+
+    stop = threading.Event()
+    worker = threading.Thread(target=main.run_worker, args=(backend, stop, 0.05))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while get_job(backend, job_id)["status"] != "success" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    worker.join()
+
+    job = get_job(backend, job_id)
+    assert job["status"] == "success"
+    assert job["result"] == {"status": "success", "url": "u"}
+    assert "secret" not in str(job)
+
+def test_worker_survives_backend_errors(monkeypatch):
+    monkeypatch.setattr(main.SubtitlePipeline, "process",
+                        lambda self, url: {"status": "success", "url": url})
+    monkeypatch.setattr(main, "WORKER_MAX_BACKOFF", 0.01)
+
+    class FlakyBackend(MemoryBackend):
+        """前两次取任务、第一次心跳和第一次确认都模拟连接错误"""
+        failures = {"reserve": 2, "heartbeat": 1, "ack": 1}
+
+        def _maybe_fail(self, name):
+            if self.failures[name]:
+                self.failures[name] -= 1
+                raise ConnectionError(f"{name} failed")
+
+        def reserve(self, *args, **kwargs):
+            self._maybe_fail("reserve")
+            return super().reserve(*args, **kwargs)
+
+        def heartbeat(self, *args, **kwargs):
+            self._maybe_fail("heartbeat")
+            return super().heartbeat(*args, **kwargs)
+
+        def ack(self, *args, **kwargs):
+            self._maybe_fail("ack")
+            return super().ack(*args, **kwargs)
+
+    backend = FlakyBackend()
+    first, second = submit_job(backend, {"url": "u1"}), submit_job(backend, {"url": "u2"})
+    stop = threading.Event()
+    worker = threading.Thread(target=main.run_worker, args=(backend, stop, 0.05))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while not all(get_job(backend, j)["status"] == "success" for j in (first, second)) \
+            and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # worker 线程没有因为后端错误退出
+    assert worker.is_alive()
+    stop.set()
+    worker.join()
+    assert all(get_job(backend, j)["status"] == "success" for j in (first, second))
+    assert backend.failures == {"reserve": 0, "heartbeat": 0, "ack": 0}
+
+def test_jobs_of_dead_worker_are_requeued():
+    backend = MemoryBackend()
+    backend.push("q", "job-1")
+    backend.heartbeat("q", "dead", ttl=0.05)
+    # worker 取出任务后进程退出，既没有 ack 也不再刷新心跳
+    assert backend.reserve("q", "dead", timeout=0.1) == "job-1"
+    assert backend.pop("q", timeout=0.01) is None
+    assert backend.requeue_stale("q") == 0
+
+    time.sleep(0.06)
+    assert backend.requeue_stale("q") == 1
+    backend.heartbeat("q", "alive", ttl=10)
+    assert backend.reserve("q", "alive", timeout=0.1) == "job-1"
+    backend.ack("q", "alive", "job-1")
+    assert backend.requeue_stale("q") == 0
+    assert backend._queues["q:processing:alive"] == deque()
+
+def test_running_job_records_worker_and_start_time(monkeypatch):
+    seen = {}
+    backend = MemoryBackend()
+
+    def process(self, url):
+        seen.update(get_job(backend, job_id))
+        return {"status": "success", "url": url}
+
+    monkeypatch.setattr(main.SubtitlePipeline, "process", process)
+    job_id = submit_job(backend, {"url": "u", "send_to_coze": False})
+    stop = threading.Event()
+    worker = threading.Thread(target=main.run_worker, args=(backend, stop, 0.05, "w1"))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while get_job(backend, job_id)["status"] != "success" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    worker.join()
+    assert seen["status"] == "running" and seen["worker"] == "w1" and seen["started_at"] > 0
+    assert backend._queues[f"{JOB_QUEUE}:processing:w1"] == deque()
+
+def test_redis_backend_round_trip():
+    fakeredis = pytest.importorskip("fakeredis")
+    # redis-py 的锁释放使用 Lua 脚本，fakeredis 需要 lupa 才能执行
+    pytest.importorskip("lupa")
+    backend = RedisBackend("redis://fake", client=fakeredis.FakeRedis(decode_responses=True))
+
+    backend.set("a", "1", ttl=60)
+    assert backend.get("a") == "1"
+    backend.delete("a")
+    assert backend.get("a") is None
+
+    with backend.lock("l", timeout=5):
+        assert _try_lock(backend, "l", blocking_timeout=0.05) is False
+    assert _try_lock(backend, "l", blocking_timeout=0.05) is True
+
+    backend.push("q", "x")
+    backend.push("q", "y")
+    assert backend.pop("q", timeout=1) == "x"
+    backend.heartbeat("q", "w", ttl=60)
+    assert backend.reserve("q", "w", timeout=1) == "y"
+    assert backend.requeue_stale("q") == 0
+    backend.client.delete("q:heartbeat:w")
+    assert backend.requeue_stale("q") == 1
+    assert backend.reserve("q", "w2", timeout=1) == "y"
+    backend.ack("q", "w2", "y")
+    assert backend.client.llen("q:processing:w2") == 0
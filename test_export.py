@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+测试字幕列式导出（需要 pyarrow）
+"""
+
+import io
+import os
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from export import export_incremental, parse_subtitle_name, stream_export
+
+VTT = """WEBVTT
+Kind: captions
+Language: en
+
+00:00:00.360 --> 00:00:06.040
+Hello&nbsp;
+world
+
+00:00:06.040 --> 00:00:13.400
+second <c>cue</c>
+
+00:00:13.400 --> 00:00:18.680
+third cue
+"""
+
+def _write_video(directory, name, content=VTT, summary=None):
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        f.write(content)
+    if summary is not None:
+        md = os.path.join(directory, os.path.splitext(name)[0] + "_coze_result.md")
+        with open(md, "w", encoding="utf-8") as f:
+            f.write(summary)
+
+def test_parse_subtitle_name():
+    assert parse_subtitle_name("My title [dQw4w9WgXcQ].en.vtt") == ("dQw4w9WgXcQ", "en")
+    assert parse_subtitle_name("Old title.en.vtt") == ("Old title", "en")
+
+def _parts(directory):
+    return sorted(os.path.join(directory, p) for p in os.listdir(directory))
+
+def test_incremental_parquet_export(tmp_path):
+    subs = tmp_path / "subs"
+    out = tmp_path / "out"
+    subs.mkdir()
+    _write_video(str(subs), "A [aaaaaaaaaaa].en.vtt", summary="# 摘要 A")
+
+    stats = export_incremental(str(subs), str(out), fmt="parquet", batch_size=2)
+    assert stats["files"] == 1
+    assert stats["rows"] == {"cues": 3, "videos": 1}
+
+    first_part = _parts(out / "cues")[0]
+    cues = pq.read_table(first_part)
+    assert cues.column("text").to_pylist() == ["Hello world", "second cue", "third cue"]
+    assert cues.column("start_ms").to_pylist() == [360, 6040, 13400]
+    assert set(cues.column("video_id").to_pylist()) == {"aaaaaaaaaaa"}
+    videos = pq.read_table(_parts(out / "videos")[0])
+    assert videos.to_pylist()[0]["summary"] == "# 摘要 A"
+    assert videos.to_pylist()[0]["duration_ms"] == 18680
+
+    # 没有新数据时不写出任何文件
+    assert export_incremental(str(subs), str(out), fmt="parquet")["files"] == 0
+
+    # 只导出新增的视频；同一秒内的再次导出不会覆盖之前的分片
+    _write_video(str(subs), "B [bbbbbbbbbbb].en.vtt")
+    stats = export_incremental(str(subs), str(out), fmt="parquet")
+    assert stats["files"] == 1 and stats["rows"]["cues"] == 3
+    assert first_part in _parts(out / "cues") and len(_parts(out / "cues")) == 2
+
+    # 每张表的子目录可以直接作为一个数据集读取
+    table = ds.dataset(str(out / "cues"), format="parquet").to_table()
+    assert sorted(set(table.column("video_id").to_pylist())) == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+    assert len(set(table.column("run_id").to_pylist())) == 2
+
+def test_summary_written_after_export(tmp_path):
+    subs = tmp_path / "subs"
+    out = tmp_path / "out"
+    subs.mkdir()
+    _write_video(str(subs), "A [aaaaaaaaaaa].en.vtt")
+    assert export_incremental(str(subs), str(out), fmt="parquet")["files"] == 1
+
+    # Coze 摘要在字幕导出之后才写出，下次导出时补上
+    md = subs / "A [aaaaaaaaaaa].en_coze_result.md"
+    md.write_text("# 摘要 A", encoding="utf-8")
+    assert export_incremental(str(subs), str(out), fmt="parquet")["files"] == 1
+    assert export_incremental(str(subs), str(out), fmt="parquet")["files"] == 0
+
+    videos = ds.dataset(str(out / "videos"), format="parquet").to_table().to_pylist()
+    latest = max(videos, key=lambda row: row["run_id"])
+    assert latest["summary"] == "# 摘要 A"
+
+def test_stream_arrow_export(tmp_path):
+    _write_video(str(tmp_path), "A [aaaaaaaaaaa].en.vtt")
+    _write_video(str(tmp_path), "B [bbbbbbbbbbb].de.vtt")
+    data = b"".join(stream_export(str(tmp_path), "cues", "arrow", batch_size=2))
+    table = pa.ipc.open_stream(io.BytesIO(data)).read_all()
+    assert table.num_rows == 6
+    assert sorted(set(table.column("lang").to_pylist())) == ["de", "en"]
+
+    data = b"".join(stream_export(str(tmp_path), "videos", "parquet"))
+    assert pq.read_table(io.BytesIO(data)).num_rows == 2
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试直播字幕增量清洗（用本地不断增长的 VTT 文件模拟直播分段）
+"""
+
+import threading
+
+from live import FileTailSource, IncrementalSubtitleCleaner, LiveSubtitleTail
+
+# 模拟直播中依次到达的 VTT 分段，自动字幕会在下一个字幕块中重复上一行
+SEGMENTS = [
+    "WEBVTT\nKind: captions\nLanguage: en\n\n"
+    "00:00:00.000 --> 00:00:02.000\n"
+    "hello<00:00:00.500><c> everyone</c>\n\n"
+    "00:00:02.000 --> 00:00:04.000\n"
+    "hello everyone\nwelcome to&nbsp;the\n\n",
+    # 第二个分段在字幕块中间截断
+    "00:00:04.000 --> 00:00:06.000\n"
+    "welcome to the\nlive ",
+    "stream\n\n"
+    # 分段重叠导致的重放字幕块
+    "00:00:02.000 --> 00:00:04.000\n"
+    "hello everyone\nwelcome to the\n\n"
+    "00:00:06.000 --> 00:00:08.000\n"
+    "live stream\ngoodbye\n",
+]
+
+def test_incremental_cleaner_dedups_across_segments():
+    cleaner = IncrementalSubtitleCleaner()
+    assert cleaner.feed(SEGMENTS[0]) == ["hello everyone", "welcome to the"]
+    # 未完整的字幕块不会输出
+    assert cleaner.feed(SEGMENTS[1]) == []
+    assert cleaner.feed(SEGMENTS[2]) == ["live stream"]
+    assert cleaner.flush() == ["goodbye"]
+
+def test_incremental_cleaner_keeps_repeated_short_phrases():
+    cleaner = IncrementalSubtitleCleaner()
+    lines = cleaner.feed(
+        "WEBVTT\n\n"
+        "00:00:00.000 --> 00:00:01.000\nare you ready\n\n"
+        "00:00:01.000 --> 00:00:02.000\nyes\n\n"
+        "00:00:02.000 --> 00:00:03.000\nyes\nlet's go\n\n"
+        "00:00:03.000 --> 00:00:04.000\ndo you agree\n\n"
+        "00:00:04.000 --> 00:00:05.000\nyes\n",
+        final=True,
+    )
+    # 相邻字幕块的滚动重复被去掉，不相邻的 "yes" 保留
+    assert lines == ["are you ready", "yes", "let's go", "do you agree", "yes"]
+
+def test_live_tail_pushes_only_new_text(tmp_path):
+    path = tmp_path / "live.en.vtt"
+    tail = LiveSubtitleTail(FileTailSource(str(path)), poll_interval=0)
+    pushed = []
+    tail.subscribe(pushed.append)
+
+    # 文件尚未创建
+    assert tail.poll_once() == ""
+    for segment in SEGMENTS:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(segment)
+        tail.poll_once()
+
+    stop = threading.Event()
+    stop.set()
+    transcript = tail.run(stop)
+
+    assert pushed == ["hello everyone welcome to the", "live stream", "goodbye"]
+    assert transcript == "hello everyone welcome to the live stream goodbye"
+    # 缓冲区只保留未完成的字幕块，不随直播时长增长
+    assert tail.cleaner._buffer == ""
+
+def test_live_tail_recovers_from_source_errors():
+    class FlakySource:
+        """第二次拉取时模拟一次 5xx，之后恢复"""
+        ended = False
+
+        def __init__(self):
+            self.reads = 0
+            self.pending = list(SEGMENTS)
+
+        def read_new(self):
+            self.reads += 1
+            if self.reads == 2:
+                raise ConnectionError("503 Service Unavailable")
+            chunk = self.pending.pop(0)
+            self.ended = not self.pending
+            return chunk
+
+    source = FlakySource()
+    tail = LiveSubtitleTail(source, poll_interval=0)
+    pushed = []
+    tail.subscribe(pushed.append)
+
+    transcript = tail.run()
+    assert source.reads == len(SEGMENTS) + 1
+    # 出错前后的文本都在，滚动去重状态没有丢失
+    assert pushed == ["hello everyone welcome to the", "live stream", "goodbye"]
+    assert transcript == "hello everyone welcome to the live stream goodbye"
+
+def test_live_tail_periodic_summary(tmp_path, monkeypatch):
+    import live
+
+    sent = []
+    monkeypatch.setattr(live, "send_to_coze_workflow",
+                        lambda workflow_id, token, text, file_name, session=None:
+                        sent.append(text) or {"data": "ok"})
+    path = tmp_path / "live.en.vtt"
+    path.write_text(SEGMENTS[0], encoding="utf-8")
+    tail = LiveSubtitleTail(FileTailSource(str(path)), poll_interval=0,
+                            summary_interval=3600, workflow_id="1", token="t")
+    summaries = []
+    tail.subscribe_summary(summaries.append)
+
+    stop = threading.Event()
+    stop.set()
+    tail.run(stop)
+    assert sent == ["hello everyone welcome to the"]
+    assert summaries == [{"data": "ok"}]
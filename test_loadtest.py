@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+压测工具冒烟测试：用替身启动服务并发送少量请求
+"""
+
+from loadtest import SCENARIOS, percentile, run_scenario
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
+
+def test_run_small_scenario():
+    scenario = dict(SCENARIOS["baseline"], concurrency=2, requests=4,
+                    ytdlp_delay=0.0, coze_latency=0.0)
+    result = run_scenario("smoke", scenario)
+    assert result["requests"] == 4
+    assert result["error_rate"] == 0.0
+    assert result["throughput_rps"] > 0
+    assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+def test_coze_failures_count_as_errors():
+    scenario = dict(SCENARIOS["baseline"], concurrency=2, requests=4,
+                    ytdlp_delay=0.0, coze_latency=0.0, coze_error_rate=1.0)
+    result = run_scenario("coze-down", scenario)
+    assert result["error_rate"] == 1.0
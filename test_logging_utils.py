@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+测试日志工具：敏感信息脱敏、载荷摘要和延迟格式化
+"""
+
+import json
+import logging
+
+from logging_utils import JsonFormatter, lazy, redact, summarize_text
+
+def test_redact_hides_secrets():
+    headers = {"Authorization": "Bearer secret", "Content-Type": "application/json"}
+    redacted = redact(headers)
+    assert redacted["Authorization"] == "***"
+    assert redacted["Content-Type"] == "application/json"
+    # 原字典保持不变
+    assert headers["Authorization"] == "Bearer secret"
+    assert redact({"url": "u", "token": "t"}) == {"url": "u", "token": "***"}
+
+def test_summarize_text_does_not_include_content():
+    summary = summarize_text("secret transcript " * 1000)
+    assert summary.startswith("chars=18000 sha256=")
+    assert "transcript" not in summary
+
+def test_lazy_is_not_evaluated_when_level_disabled():
+    calls = []
+    logger = logging.getLogger("extract_subtitles.test_lazy")
+    logger.setLevel(logging.INFO)
+    logger.debug("payload: %s", lazy(lambda: calls.append(1)))
+    assert calls == []
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("extract_subtitles", logging.INFO, __file__, 1,
+                               "done %s", ("ok",), None)
+    record.request_id = "abc"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "done ok"
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "abc"
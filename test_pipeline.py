@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+测试 SubtitlePipeline 程序化接口（使用假的 yt-dlp，不访问网络）
+"""
+
+import main
+
+FAKE_VTT = """WEBVTT
+Kind: captions
+Language: en
+
+00:00:00.360 --> 00:00:06.040
+Hello&nbsp;
+world
+
+00:00:06.040 --> 00:00:13.400
+second cue
+"""
+
+def test_process_and_process_many(tmp_path, monkeypatch, capsys, fake_ytdlp):
+    fake_ytdlp.configure(vtt=FAKE_VTT, fail_marker="fail")
+    monkeypatch.setattr(main, "SUBTITLES_DIR", str(tmp_path))
+
+    pipeline = main.SubtitlePipeline(send_to_coze=False)
+    result = pipeline.process("https://www.youtube.com/watch?v=ok")
+    assert result["status"] == "success"
+    assert result["cleaned_text"] == "Hello world second cue"
+    assert "original_content" not in result
+
+    results = pipeline.process_many([
+        "https://www.youtube.com/watch?v=ok",
+        "https://www.youtube.com/watch?v=fail",
+    ])
+    assert [r["status"] for r in results] == ["success", "error"]
+    assert "Video unavailable" in results[1]["error"]
+
+    # 静默模式下不应向控制台输出任何内容
+    assert capsys.readouterr().out == ""
+
+def test_save_coze_markdown(tmp_path):
+    subtitle_file = str(tmp_path / "video.en.vtt")
+    md = main.save_coze_markdown({"data": '{"summary": "# 摘要"}'}, subtitle_file)
+    assert md == str(tmp_path / "video.en_coze_result.md")
+    with open(md, encoding="utf-8") as f:
+        assert f.read() == "# 摘要"
+    assert main.save_coze_markdown({"code": 4000}, subtitle_file) is None
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试分阶段耗时记录、采样分析器和管理接口
+"""
+
+import time
+
+import pytest
+
+import main
+from config import Config
+from profiling import SamplingProfiler, span, trace_context
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += 1
+    return total
+
+def test_spans_are_recorded_only_inside_trace():
+    with span("ignored"):
+        pass
+    with trace_context("req-1") as trace:
+        with span("clean"):
+            _busy(0.01)
+    assert [s["name"] for s in trace.spans] == ["clean"]
+    assert trace.spans[0]["duration_ms"] >= 10
+    assert trace.server_timing().startswith("clean;dur=")
+
+def test_sampling_profiler_produces_folded_stacks():
+    profiler = SamplingProfiler(interval=0.001).start()
+    _busy(0.1)
+    profiler.stop()
+    folded = profiler.folded()
+    assert "_busy (test_profiling.py:" in folded
+    stack, count = folded.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "ADMIN_TOKEN", "secret")
+    return main.app.test_client()
+
+def test_profile_on_demand_via_header(client, tmp_path):
+    response = client.get("/health", headers={"X-Request-ID": "abc123"})
+    assert response.headers["X-Request-ID"] == "abc123"
+    assert "X-Profile-Id" not in response.headers
+
+    response = client.get("/health", headers={"X-Request-ID": "abc124", "X-Profile": "secret"})
+    assert response.headers["X-Profile-Id"] == "abc124"
+    assert (tmp_path / "abc124.folded").exists()
+
+    auth = {"Authorization": "Bearer secret"}
+    assert client.get("/admin/profiles", headers=auth).get_json() == {"profiles": ["abc124"]}
+    record = client.get("/admin/profiles/abc124?format=json", headers=auth).get_json()
+    assert record["path"] == "/health" and record["status"] == 200
+
+def test_admin_profile_budget(client, tmp_path):
+    assert client.post("/admin/profile", json={"count": 1}).status_code == 403
+    auth = {"Authorization": "Bearer secret"}
+    assert client.post("/admin/profile", json={"count": 1}, headers=auth).get_json()["remaining"] == 1
+    assert "X-Profile-Id" in client.get("/health").headers
+    assert "X-Profile-Id" not in client.get("/health").headers
+
+def test_unsafe_request_id_is_replaced(client, tmp_path, monkeypatch):
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setattr(Config, "PROFILE_DIR", str(profile_dir))
+    monkeypatch.setattr(Config, "PROFILE_SAMPLE_RATE", 1.0)
+    response = client.get("/health", headers={"X-Request-ID": "../escaped"})
+    request_id = response.headers["X-Request-ID"]
+    assert request_id != "../escaped"
+    assert response.headers["X-Profile-Id"] == request_id
+    assert not (tmp_path / "escaped.folded").exists()
+    assert (profile_dir / f"{request_id}.folded").exists()
+
+def test_markdown_response_timing_names_prepare_stage(client, tmp_path, monkeypatch):
+    markdown_file = tmp_path / "video.en_coze_result.md"
+    markdown_file.write_text("# 摘要\n", encoding="utf-8")
+    monkeypatch.setattr(main, "SUBTITLES_DIR", str(tmp_path))
+    monkeypatch.setattr(main.SubtitlePipeline, "process",
+                        lambda self, url: {"status": "success", "markdown_file": str(markdown_file)})
+
+    response = client.post("/download-subtitle", json={"url": "u", "workflow_id": "1", "token": "t"})
+    assert response.data == "# 摘要\n".encode("utf-8")
+    # 文件内容在视图返回后才发送，Server-Timing 只声明构造响应的阶段
+    assert response.headers["Server-Timing"].startswith("prepare_file;dur=")
+    assert "send_file" not in response.headers["Server-Timing"]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+测试已保存文件的下载：ETag / 304、Range、X-Accel-Redirect 和路径校验
+"""
+
+import pytest
+
+import main
+from config import Config
+
+CONTENT = "# 摘要\n\n这是 Coze 生成的摘要内容。\n".encode("utf-8")
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "SUBTITLES_DIR", str(tmp_path))
+    (tmp_path / "video [abc].en_coze_result.md").write_bytes(CONTENT)
+    return main.app.test_client()
+
+def _get(client, headers=None):
+    return client.get("/download-markdown",
+                      query_string={"file": "video [abc].en_coze_result.md"},
+                      headers=headers or {})
+
+def test_etag_and_not_modified(client):
+    response = _get(client)
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.mimetype == "text/markdown"
+    assert response.headers["Cache-Control"]
+    assert response.headers["Last-Modified"]
+    etag = response.headers["ETag"]
+
+    response = _get(client, {"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+def test_range_request(client):
+    response = _get(client, {"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.data == CONTENT[:8]
+    assert response.headers["Content-Range"] == f"bytes 0-7/{len(CONTENT)}"
+
+def test_etag_changes_with_content(client, tmp_path):
+    etag = _get(client).headers["ETag"]
+    (tmp_path / "video [abc].en_coze_result.md").write_bytes(CONTENT + b"more")
+    response = _get(client, {"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_x_accel_redirect(client, monkeypatch):
+    monkeypatch.setattr(Config, "X_ACCEL_REDIRECT_PREFIX", "/protected/")
+    response = _get(client)
+    assert response.status_code == 200
+    assert response.data == b""
+    assert response.headers["X-Accel-Redirect"] == "/protected/video%20%5Babc%5D.en_coze_result.md"
+    assert _get(client, {"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+def test_rejects_paths_outside_subtitles_dir(client):
+    response = client.get("/download-markdown", query_string={"file": "../config.py"})
+    assert response.status_code == 404
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+测试流式处理：逐行清洗到缓冲区、流式 Coze 请求体和 JSON 响应，以及峰值内存不随文件大小增长
+"""
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import main
+from config import Config
+from membench import measure_peak, streaming_request, write_sample_vtt
+
+SAMPLE_VTT = """WEBVTT
+Kind: captions
+Language: en
+
+00:00:00.360 --> 00:00:06.040
+Hello&nbsp;  "quoted"
+world \\ backslash
+
+00:00:06.040 --> 00:00:13.400
+第二段	字幕
+
+01:00:06.040 --> 01:00:13.400
+last cue without newline"""
+
+def _write(tmp_path, content):
+    path = tmp_path / "video [abc].en.vtt"
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+def test_clean_subtitle_file_matches_in_memory(tmp_path):
+    path = _write(tmp_path, SAMPLE_VTT)
+    expected = main.clean_subtitle_content(SAMPLE_VTT)
+    # max_size 很小，强制转存到临时文件
+    with main.clean_subtitle_file(path, max_size=16) as spool:
+        assert spool.text() == expected
+        assert spool.chars == len(expected)
+        assert spool.hexdigest() == hashlib.sha256(expected.encode("utf-8")).hexdigest()
+    with main.clean_subtitle_file(path, clean_text=False) as spool:
+        assert spool.text() == SAMPLE_VTT
+
+def test_spooled_json_document(tmp_path):
+    path = _write(tmp_path, SAMPLE_VTT)
+    with main.clean_subtitle_file(path) as spool:
+        document = {"status": "success", "cleaned_text": spool, "extra": {"n": 1}}
+        body = main.SpooledJsonDocument(document, spool)
+        encoded = b"".join(body)
+        assert len(body) == len(encoded)
+        assert json.loads(encoded) == {"status": "success", "cleaned_text": spool.text(), "extra": {"n": 1}}
+
+def test_send_to_coze_streams_payload(tmp_path, monkeypatch):
+    received = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received["length"] = self.headers.get("Content-Length")
+            received["body"] = self.rfile.read(int(received["length"]))
+            data = json.dumps({"code": 0, "data": json.dumps({"summary": "ok"})}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(Config, "COZE_API_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/run")
+    try:
+        with main.clean_subtitle_file(_write(tmp_path, SAMPLE_VTT)) as spool:
+            response = main.send_to_coze_workflow("1", "token", spool, "video.vtt")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert response["code"] == 0
+    assert received["length"] == str(len(received["body"]))
+    assert json.loads(received["body"]) == {
+        "workflow_id": 1,
+        "parameters": {"subtitle": main.clean_subtitle_content(SAMPLE_VTT)},
+    }
+
+def test_download_subtitle_stream_response(tmp_path, monkeypatch):
+    path = _write(tmp_path, SAMPLE_VTT)
+    monkeypatch.setattr(main, "download_subtitle", lambda *args: path)
+    client = main.app.test_client()
+    response = client.post("/download-subtitle", json={
+        "url": "https://www.youtube.com/watch?v=abc", "send_to_coze": False, "stream": True,
+    })
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["cleaned_text"] == main.clean_subtitle_content(SAMPLE_VTT)
+    assert result["subtitle_file"] == path
+    assert "original_content" not in result
+    assert response.headers["Content-Length"] == str(len(response.data))
+
+def test_streaming_peak_memory_is_flat(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SPOOL_MAX_SIZE", 64 * 1024)
+    small, large = str(tmp_path / "small.vtt"), str(tmp_path / "large.vtt")
+    write_sample_vtt(small, 5000)
+    large_size = write_sample_vtt(large, 40000)
+
+    small_peak = measure_peak(streaming_request, small)
+    large_peak = measure_peak(streaming_request, large)
+    # 文件大 8 倍，峰值内存基本不变，且远小于文件大小
+    assert large_peak < small_peak * 1.5
+    assert large_peak < large_size / 8
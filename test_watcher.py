@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+测试频道监视器（使用假的 yt-dlp，不访问网络）
+"""
+
+import json
+
+import main
+from watcher import ChannelWatcher, DownloadArchive, list_channel_video_ids
+
+CHANNEL = "https://www.youtube.com/@example/videos"
+
+def _set_uploads(tmp_path, ids):
+    (tmp_path / "channel_ids.txt").write_text("\n".join(ids) + "\n", encoding="utf-8")
+
+def _downloaded_ids(fake_ytdlp):
+    return [url.split("v=")[-1] for url in fake_ytdlp.calls()]
+
+def test_list_stops_at_high_water_mark(tmp_path, fake_ytdlp):
+    fake_ytdlp.configure(playlist=tmp_path / "channel_ids.txt")
+    _set_uploads(tmp_path, ["v4", "v3", "v2", "v1"])
+    assert list_channel_video_ids(CHANNEL, stop_at="v2") == ["v4", "v3"]
+    assert list_channel_video_ids(CHANNEL) == ["v4", "v3", "v2", "v1"]
+
+def test_watcher_processes_only_unseen_videos(tmp_path, monkeypatch, fake_ytdlp):
+    fake_ytdlp.configure(playlist=tmp_path / "channel_ids.txt", fail_marker="bad",
+                         vtt="WEBVTT\n\n00:00:00.000 --> 00:00:01.000\n{video_id}\n")
+    monkeypatch.setattr(main, "SUBTITLES_DIR", str(tmp_path))
+    archive_file = str(tmp_path / "archive.txt")
+    state_file = str(tmp_path / "state.json")
+
+    def make_watcher():
+        return ChannelWatcher(
+            [CHANNEL],
+            pipeline=main.SubtitlePipeline(send_to_coze=False),
+            archive_file=archive_file,
+            state_file=state_file,
+            initial_limit=10,
+            max_per_poll=10,
+            max_attempts=3,
+        )
+
+    _set_uploads(tmp_path, ["bad1", "v2", "v1"])
+    results = make_watcher().poll_once()[CHANNEL]
+    assert [r["video_id"] for r in results] == ["v1", "v2", "bad1"]
+    assert _downloaded_ids(fake_ytdlp) == ["v1", "v2"]
+
+    # 新的监视器实例从磁盘恢复状态：只处理新上传的 v3 和上次失败的 bad1
+    _set_uploads(tmp_path, ["v3", "bad1", "v2", "v1"])
+    results = make_watcher().poll_once()[CHANNEL]
+    assert [r["video_id"] for r in results] == ["bad1", "v3"]
+    assert _downloaded_ids(fake_ytdlp) == ["v1", "v2", "v3"]
+
+    with open(state_file, encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["high_water_marks"][CHANNEL] == "v3"
+    assert state["pending"][CHANNEL] == {"bad1": 2}
+    archive = DownloadArchive(archive_file)
+    assert len(archive) == 3 and "v3" in archive and "bad1" not in archive
+
+    # 第三次失败后不再重试，之后的检查不会再为它运行 yt-dlp
+    results = make_watcher().poll_once()[CHANNEL]
+    assert [r["video_id"] for r in results] == ["bad1"]
+    with open(state_file, encoding="utf-8") as f:
+        state = json.load(f)
+    assert CHANNEL not in state["pending"]
+    assert state["parked"][CHANNEL] == ["bad1"]
+    assert make_watcher().poll_once()[CHANNEL] == []
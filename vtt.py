@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+WebVTT 字幕块解析工具（不依赖 Flask，可被导出、直播等模块共用）
+"""
+
+import re
+
+# 字幕块时间戳，小时部分可省略，例如 00:01.000 --> 00:03.500
+CUE_TIMING_PATTERN = re.compile(
+    r'^(?:(\d+):)?(\d{2}):(\d{2})\.(\d{3})\s+-->\s+(?:(\d+):)?(\d{2}):(\d{2})\.(\d{3})'
+)
+# 自动字幕中逐词高亮的内联标签，如 <00:00:01.000><c> word</c>
+INLINE_TAG_PATTERN = re.compile(r'<[^>]*>')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def _to_ms(hours, minutes, seconds, millis):
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+def parse_cue_timing(line):
+    """
+    解析时间戳行
+
+    Args:
+        line (str): 去除首尾空白后的行
+
+    Returns:
+        tuple: (start_ms, end_ms)，不是时间戳行时返回 None
+    """
+    match = CUE_TIMING_PATTERN.match(line)
+    if not match:
+        return None
+    groups = match.groups()
+    return _to_ms(*groups[:4]), _to_ms(*groups[4:])
+
+def clean_cue_text(text):
+    """替换 &nbsp;、去除内联标签并合并多余空白"""
+    text = INLINE_TAG_PATTERN.sub('', text.replace('&nbsp;', ' '))
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+def iter_cues(lines):
+    """
+    逐行解析 VTT，依次产出字幕块，只在内存中保留当前字幕块
+
+    Args:
+        lines (iterable): VTT 文本行（例如打开的文件对象）
+
+    Yields:
+        tuple: (start_ms, end_ms, 清洗后的文本)，空文本的字幕块会被跳过
+    """
+    timing = None
+    text_lines = []
+    for line in lines:
+        stripped = line.strip()
+        if timing is None:
+            timing = parse_cue_timing(stripped)
+            continue
+        if stripped:
+            text_lines.append(stripped)
+            continue
+        # 空行结束当前字幕块
+        text = clean_cue_text(' '.join(text_lines))
+        if text:
+            yield timing[0], timing[1], text
+        timing = None
+        text_lines = []
+    if timing is not None:
+        text = clean_cue_text(' '.join(text_lines))
+        if text:
+            yield timing[0], timing[1], text
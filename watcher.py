@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+频道监视器：定期检查频道，只处理尚未处理过的新视频
+功能：
+1. 用 yt-dlp 的扁平提取（--flat-playlist）按从新到旧列出频道上传的视频 ID
+2. 遇到该频道上次记录的最新视频（高水位标记）即停止列出，开销只与新上传数量相关
+3. 持久化下载归档（与 yt-dlp --download-archive 格式相同），已处理的视频不会重复下载和发送到 Coze
+4. 新视频通过 SubtitlePipeline（基于 download_subtitle）依次处理，失败的视频在下一轮重试，
+   连续失败达到上限后不再重试
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from config import Config
+from logging_utils import get_logger, configure_logging, lazy
+from main import SubtitlePipeline
+
+logger = get_logger("watcher")
+
+def video_url(video_id):
+    """根据视频 ID 生成 YouTube 视频链接"""
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def list_channel_video_ids(channel_url, stop_at=None, limit=None):
+    """
+    用扁平提取按从新到旧列出频道视频 ID，不解析单个视频页面
+
+    Args:
+        channel_url (str): 频道上传列表链接，如 https://www.youtube.com/@name/videos
+        stop_at (str): 遇到该视频 ID 时立即停止（不包含该 ID），并终止 yt-dlp 进程
+        limit (int): 最多列出的视频数量
+
+    Returns:
+        list: 视频 ID 列表，从新到旧
+    """
+    cmd = ["yt-dlp", "--flat-playlist", "--lazy-playlist", "--print", "id"]
+    if limit:
+        cmd.extend(["--playlist-end", str(limit)])
+    cmd.append(channel_url)
+    logger.debug("执行命令: %s", lazy(' '.join, cmd))
+
+    video_ids = []
+    stopped_early = False
+    # stderr 写入临时文件，避免读取 stdout 时管道写满阻塞
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+        try:
+            for line in process.stdout:
+                video_id = line.strip()
+                if not video_id:
+                    continue
+                if video_id == stop_at:
+                    stopped_early = True
+                    break
+                video_ids.append(video_id)
+            if stopped_early:
+                process.kill()
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+
+        if returncode != 0 and not stopped_early:
+            stderr_file.seek(0)
+            error_msg = stderr_file.read().decode('utf-8', errors='replace').strip()
+            raise Exception(f"列出频道视频失败: {error_msg}")
+    return video_ids
+
+class DownloadArchive:
+    """
+    已处理视频的持久化归档，文件格式与 yt-dlp 的 --download-archive 相同（每行 "youtube <视频ID>"）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2:
+                        self._ids.add(parts[1])
+
+    def __contains__(self, video_id):
+        return video_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, video_id):
+        """记录一个已处理的视频，立即追加写入文件"""
+        if video_id in self._ids:
+            return
+        self._ids.add(video_id)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"youtube {video_id}\n")
+
+class ChannelWatcher:
+    """
+    频道监视器
+
+    状态文件记录每个频道的高水位标记（上次列出的最新视频 ID）、待重试的视频 ID 及其失败次数，
+    以及失败次数达到上限、不再自动重试的视频 ID。
+    """
+
+    def __init__(self, channels, pipeline=None, archive_file=None, state_file=None,
+                 initial_limit=None, max_per_poll=None, max_attempts=None):
+        """
+        Args:
+            channels (list): 频道上传列表链接
+            pipeline (SubtitlePipeline): 处理新视频用的流水线，默认使用 Config 中的 Coze 配置
+            archive_file (str): 下载归档文件路径，默认为 Config.WATCH_ARCHIVE_FILE
+            state_file (str): 高水位标记状态文件路径，默认为 Config.WATCH_STATE_FILE
+            initial_limit (int): 首次检查一个频道时最多处理的视频数量
+            max_per_poll (int): 每次检查单个频道时最多列出的视频数量
+            max_attempts (int): 同一视频最多尝试的次数，默认为 Config.WATCH_MAX_ATTEMPTS
+        """
+        self.channels = list(channels)
+        self.pipeline = pipeline or SubtitlePipeline()
+        self.archive = DownloadArchive(archive_file or Config.WATCH_ARCHIVE_FILE)
+        self.state_file = state_file or Config.WATCH_STATE_FILE
+        self.initial_limit = initial_limit or Config.WATCH_INITIAL_LIMIT
+        self.max_per_poll = max_per_poll or Config.WATCH_MAX_PER_POLL
+        self.max_attempts = max_attempts or Config.WATCH_MAX_ATTEMPTS
+        self.state = self._load_state()
+
+    def _load_state(self):
+        state = {"high_water_marks": {}, "pending": {}, "parked": {}}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state.update(json.load(f))
+        for channel_url, pending in state["pending"].items():
+            # 旧版状态文件中待重试的视频是列表，按已失败一次处理
+            if isinstance(pending, list):
+                state["pending"][channel_url] = {video_id: 1 for video_id in pending}
+        return state
+
+    def _save_state(self):
+        # 先写临时文件再替换，避免中途退出导致状态文件损坏
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    def find_new_videos(self, channel_url):
+        """
+        列出频道中尚未处理的视频，并更新该频道的高水位标记
+
+        Returns:
+            list: 待处理的视频 ID，从旧到新（包括上一轮失败待重试的视频）
+        """
+        marks = self.state["high_water_marks"]
+        mark = marks.get(channel_url)
+        limit = self.max_per_poll if mark else self.initial_limit
+        listed = list_channel_video_ids(channel_url, stop_at=mark, limit=limit)
+        if listed:
+            marks[channel_url] = listed[0]
+
+        pending = list(self.state["pending"].get(channel_url, {}))
+        parked = set(self.state["parked"].get(channel_url, []))
+        queued = []
+        for video_id in pending + list(reversed(listed)):
+            if video_id not in self.archive and video_id not in parked and video_id not in queued:
+                queued.append(video_id)
+        logger.info("频道 %s: 新上传 %d 个，待处理 %d 个", channel_url, len(listed), len(queued))
+        return queued
+
+    def poll_once(self):
+        """
+        检查所有频道一次并处理新视频
+
+        Returns:
+            dict: {频道链接: [SubtitlePipeline 结果字典]}
+        """
+        results = {}
+        for channel_url in self.channels:
+            try:
+                queued = self.find_new_videos(channel_url)
+            except Exception as e:
+                logger.warning("检查频道 %s 失败: %s", channel_url, e)
+                results[channel_url] = [{"status": "error", "url": channel_url, "error": str(e)}]
+                continue
+
+            channel_results = self.pipeline.process_many(video_url(v) for v in queued)
+            attempts = self.state["pending"].get(channel_url, {})
+            failed = {}
+            for video_id, result in zip(queued, channel_results):
+                result["video_id"] = video_id
+                if result["status"] == "success":
+                    self.archive.add(video_id)
+                    continue
+                failures = attempts.get(video_id, 0) + 1
+                if failures >= self.max_attempts:
+                    # 长期不可用的视频（私享、会员专属、没有字幕）不再每轮重复运行 yt-dlp
+                    self.state["parked"].setdefault(channel_url, []).append(video_id)
+                    logger.warning("处理视频 %s 已失败 %d 次，不再重试: %s",
+                                   video_id, failures, result.get("error"))
+                else:
+                    failed[video_id] = failures
+                    logger.warning("处理视频 %s 失败（第 %d 次）: %s", video_id, failures, result.get("error"))
+
+            if failed:
+                self.state["pending"][channel_url] = failed
+            else:
+                self.state["pending"].pop(channel_url, None)
+            self._save_state()
+            results[channel_url] = channel_results
+        return results
+
+    def run(self, interval, stop_event=None):
+        """
+        按固定间隔循环检查，直到 stop_event 被设置
+
+        Args:
+            interval (float): 两轮检查之间的间隔（秒）
+            stop_event (threading.Event): 可选的停止信号
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            started = time.monotonic()
+            self.poll_once()
+            logger.info("本轮检查完成，用时 %.1f 秒", time.monotonic() - started)
+            stop_event.wait(interval)
+
+def load_channels(args):
+    """
+    解析命令行参数中的频道：可以直接是频道链接，也可以是每行一个链接的文本文件（# 开头为注释）
+    """
+    channels = []
+    for arg in args:
+        if os.path.isfile(arg):
+            with open(arg, 'r', encoding='utf-8') as f:
+                channels.extend(
+                    line.strip() for line in f
+                    if line.strip() and not line.strip().startswith('#')
+                )
+        else:
+            channels.append(arg)
+    return channels
+
+def main():
+    """
+    命令行模式：python watcher.py <频道链接或频道列表文件>...
+    WATCH_INTERVAL 为 0 时只检查一次，否则按该间隔（秒）持续检查
+    """
+    if len(sys.argv) < 2:
+        print("用法: python watcher.py <频道链接或频道列表文件>...")
+        sys.exit(1)
+
+    Config.load_from_file()
+    configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT)
+    channels = load_channels(sys.argv[1:])
+
+    with SubtitlePipeline() as pipeline:
+        watcher = ChannelWatcher(channels, pipeline=pipeline)
+        if Config.WATCH_INTERVAL > 0:
+            try:
+                watcher.run(Config.WATCH_INTERVAL)
+            except KeyboardInterrupt:
+                pass
+        else:
+            watcher.poll_once()
+
+if __name__ == '__main__':
+    main()
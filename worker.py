@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+共享任务队列 worker：从 BACKEND_URL 指定的共享后端取出 /jobs 提交的任务并处理
+
+可以在任意多个节点上运行，每个任务只会被一个 worker 处理：
+    BACKEND_URL=redis://redis-host:6379/0 python worker.py [线程数]
+"""
+
+import sys
+
+from config import Config
+from logging_utils import configure_logging
+import main
+
+def run():
+    configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT)
+    if main.BACKEND is None:
+        print("错误: 请设置 BACKEND_URL 指向共享后端，如 redis://localhost:6379/0")
+        sys.exit(1)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    threads = main.start_worker_threads(main.BACKEND, count)
+    print(f"已启动 {count} 个 worker 线程，按 Ctrl+C 退出")
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    run()